@@ -0,0 +1,274 @@
+"""
+End-to-end benchmarks for the parse, encode, build, save/load and query stages.
+
+    python -m benchmarks.run --paragraphs 20000 --output bench.json \
+        --baseline benchmarks/baseline.json
+
+By default a deterministic HashingEncoder stands in for the model so the
+benchmarks run offline; pass --model to measure a real SentenceTransformer.
+The build stage indexes the vectors from the encode stage, so it does not
+time encoding again.
+"""
+
+import argparse
+import json
+import os
+import platform
+import resource
+import sys
+import tempfile
+import time
+from parser.document_parser import PdfParser
+from parser.indexer import TextIndexer
+from parser.ingest import iter_paragraphs
+from parser.stub_encoder import HashingEncoder
+from parser.utils import metrics
+
+import faiss
+import numpy as np
+
+from benchmarks.synthetic import UploadedPdf, make_paragraphs, make_pdfs, make_queries
+
+# Metrics where a larger value is better; every other metric is a cost.
+HIGHER_IS_BETTER = ("per_s", "qps")
+# Arguments that do not change what is measured.
+IO_ARGS = ("output", "baseline", "save_baseline", "tolerance")
+
+
+def rss_bytes():
+    """Current resident set size, falling back to the peak where unavailable."""
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except (OSError, ValueError):
+        peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        return peak if sys.platform == "darwin" else peak * 1024
+
+
+def percentiles(latencies_s):
+    latencies_ms = np.asarray(latencies_s) * 1000
+    p50, p95, p99 = np.percentile(latencies_ms, [50, 95, 99])
+    return {"p50_ms": p50, "p95_ms": p95, "p99_ms": p99}
+
+
+def bench_parse(pdf_paths, pages, paragraphs_per_page, workers):
+    start = time.perf_counter()
+    pdf_parser = PdfParser([UploadedPdf(path) for path in pdf_paths])
+    pdf_parser.parse_pdf()
+    seconds = time.perf_counter() - start
+    total_pages = len(pdf_paths) * pages
+    expected = total_pages * paragraphs_per_page
+
+    start = time.perf_counter()
+    paragraphs = sum(1 for _ in iter_paragraphs(pdf_paths, workers=workers))
+    parallel_seconds = time.perf_counter() - start
+    return {
+        "parse": {
+            "seconds": seconds,
+            "pages_per_s": total_pages / seconds,
+            "paragraphs": len(pdf_parser.document_content),
+            "expected_paragraphs": expected,
+        },
+        "parse_parallel": {
+            "seconds": parallel_seconds,
+            "pages_per_s": total_pages / parallel_seconds,
+            "paragraphs": paragraphs,
+            "expected_paragraphs": expected,
+        },
+    }
+
+
+class PrecomputedEncoder:
+    """Encoder returning vectors computed earlier, so builds time no encoding."""
+
+    def __init__(self, texts, vectors):
+        self._rows = {text: row for row, text in enumerate(texts)}
+        self._vectors = vectors
+
+    def encode(self, texts, **kwargs):
+        return self._vectors[[self._rows[text] for text in texts]]
+
+
+def bench_encode(indexer, paragraphs, batch_size):
+    """Time encoding ``paragraphs``; also returns their vectors."""
+    batches = []
+    start = time.perf_counter()
+    for i in range(0, len(paragraphs), batch_size):
+        batches.append(indexer.generate_encodings(paragraphs[i : i + batch_size]))
+    seconds = time.perf_counter() - start
+    stats = {"seconds": seconds, "paragraphs_per_s": len(paragraphs) / seconds}
+    return stats, np.concatenate(batches)
+
+
+def bench_build(paragraphs, vectors, index_spec, compression, model_name):
+    indexer = TextIndexer(
+        model_name=model_name, encoder=PrecomputedEncoder(paragraphs, vectors)
+    )
+    indexer.data = paragraphs
+    rss_before = rss_bytes()
+    start = time.perf_counter()
+    indexer.build_index(index_spec=index_spec, compression=compression)
+    seconds = time.perf_counter() - start
+    stats = {
+        "seconds": seconds,
+        "paragraphs_per_s": len(paragraphs) / seconds,
+        "rss_delta_bytes": rss_bytes() - rss_before,
+    }
+    return stats, indexer
+
+
+def bench_save_load(indexer, directory, encoder, model_name):
+    path = os.path.join(directory, "bench.index")
+    start = time.perf_counter()
+    indexer.save_index(path)
+    save_seconds = time.perf_counter() - start
+
+    loaded = TextIndexer(model_name=model_name, encoder=encoder)
+    start = time.perf_counter()
+    loaded.load_index(path)
+    load_seconds = time.perf_counter() - start
+    return {"save_seconds": save_seconds, "load_seconds": load_seconds}, loaded
+
+
+def bench_search(indexer, queries, top_k, batch_size):
+    latencies = []
+    start = time.perf_counter()
+    for query in queries:
+        query_start = time.perf_counter()
+        indexer.search(query, top_k)
+        latencies.append(time.perf_counter() - query_start)
+    seconds = time.perf_counter() - start
+    single = dict(percentiles(latencies), qps=len(queries) / seconds)
+
+    start = time.perf_counter()
+    for i in range(0, len(queries), batch_size):
+        indexer.search_batch(queries[i : i + batch_size], top_k)
+    batch_seconds = time.perf_counter() - start
+    return {"search": single, "search_batch": {"qps": len(queries) / batch_seconds}}
+
+
+def run(args):
+    if args.model:
+        encoder, model_name = None, args.model
+    else:
+        encoder, model_name = HashingEncoder(args.dimension), "hashing-stub"
+    indexer = TextIndexer(model_name=model_name, encoder=encoder)
+    paragraphs = make_paragraphs(args.paragraphs, seed=args.seed)
+    queries = make_queries(args.queries, seed=args.seed + 1)
+
+    stages = {}
+    with tempfile.TemporaryDirectory() as directory:
+        pdf_paths = make_pdfs(
+            os.path.join(directory, "pdfs"),
+            args.pdfs,
+            args.pages,
+            args.paragraphs_per_page,
+            seed=args.seed,
+        )
+        stages.update(
+            bench_parse(pdf_paths, args.pages, args.paragraphs_per_page, args.workers)
+        )
+        stages["encode"], vectors = bench_encode(indexer, paragraphs, args.batch_size)
+        stages["build"], built = bench_build(
+            paragraphs, vectors, args.index_spec, args.compression, model_name
+        )
+        stages["save_load"], loaded = bench_save_load(
+            built, directory, indexer.encoder, model_name
+        )
+        stages.update(bench_search(loaded, queries, args.top_k, args.batch_size))
+
+    return {
+        "config": {
+            key: value for key, value in vars(args).items() if key not in IO_ARGS
+        },
+        "environment": {
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "faiss": faiss.__version__,
+            "numpy": np.__version__,
+        },
+        "stages": stages,
+        "metrics": metrics.snapshot(),
+    }
+
+
+def compare(report, baseline, tolerance):
+    """Return ``(stage, metric, baseline, current, change)`` for regressions."""
+    regressions = []
+    for stage, values in baseline["stages"].items():
+        for metric, expected in values.items():
+            current = report["stages"].get(stage, {}).get(metric)
+            if current is None or not expected or metric.endswith("paragraphs"):
+                continue
+            change = (current - expected) / abs(expected)
+            if metric.endswith(HIGHER_IS_BETTER):
+                change = -change
+            if change > tolerance:
+                regressions.append((stage, metric, expected, current, change))
+    return regressions
+
+
+def main(argv=None):
+    arg_parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    arg_parser.add_argument("--pdfs", type=int, default=4)
+    arg_parser.add_argument("--pages", type=int, default=25)
+    arg_parser.add_argument("--paragraphs-per-page", type=int, default=4)
+    arg_parser.add_argument("--paragraphs", type=int, default=20000)
+    arg_parser.add_argument("--queries", type=int, default=500)
+    arg_parser.add_argument("--top-k", type=int, default=10)
+    arg_parser.add_argument("--batch-size", type=int, default=256)
+    arg_parser.add_argument("--index-spec", default="Flat")
+    arg_parser.add_argument("--compression", default=None)
+    arg_parser.add_argument("--dimension", type=int, default=768)
+    arg_parser.add_argument("--model", default=None)
+    arg_parser.add_argument("--workers", type=int, default=None)
+    arg_parser.add_argument("--seed", type=int, default=0)
+    arg_parser.add_argument("--output", default=None, help="Write the JSON report")
+    arg_parser.add_argument("--baseline", default=None, help="Compare to a report")
+    arg_parser.add_argument(
+        "--save-baseline", default=None, help="Also write the report as a baseline"
+    )
+    arg_parser.add_argument(
+        "--tolerance",
+        type=float,
+        default=0.2,
+        help="Allowed relative slowdown before a metric counts as a regression",
+    )
+    args = arg_parser.parse_args(argv)
+
+    report = run(args)
+    text = json.dumps(report, indent=2)
+    print(text)
+    for stage in ("parse", "parse_parallel"):
+        parsed = report["stages"][stage]
+        if parsed["paragraphs"] != parsed["expected_paragraphs"]:
+            print(
+                f"Warning: {stage} found {parsed['paragraphs']} paragraphs, "
+                f"the PDFs hold {parsed['expected_paragraphs']}"
+            )
+    for path in (args.output, args.save_baseline):
+        if path:
+            with open(path, "w") as f:
+                f.write(text)
+
+    if args.baseline and not os.path.exists(args.baseline):
+        print(f"No baseline at {args.baseline}, record one with --save-baseline")
+    elif args.baseline:
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+        if baseline["config"] != report["config"]:
+            print("Warning: baseline was recorded with a different config")
+        regressions = compare(report, baseline, args.tolerance)
+        for stage, metric, expected, current, change in regressions:
+            print(
+                f"REGRESSION {stage}.{metric}: {expected:.4g} -> {current:.4g} "
+                f"({change:+.0%} worse)"
+            )
+        if regressions:
+            return 1
+        print(f"No regressions against {args.baseline}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,91 @@
+import os
+
+import fitz
+import numpy as np
+
+WORDS = (
+    "agreement party shall company notice term section payment date report "
+    "service right obligation law state period provision amount written "
+    "consent effect tax purpose event information control interest share "
+    "contract default remedy liability insurance exhibit schedule annex "
+    "confidential employee officer director board meeting vote fund loan"
+).split()
+
+
+# Vertical space between text blocks, in points.
+BLOCK_GAP = 12
+
+
+def make_paragraphs(count, words_per_paragraph=40, seed=0):
+    rng = np.random.default_rng(seed)
+    return [
+        " ".join(rng.choice(WORDS, words_per_paragraph)).capitalize() + "."
+        for _ in range(count)
+    ]
+
+
+def make_queries(count, words_per_query=6, seed=1):
+    return make_paragraphs(count, words_per_query, seed)
+
+
+def make_pdf(path, pages, paragraphs_per_page=4, seed=0):
+    """Write a PDF of synthetic paragraphs under a ``1.<page>`` header per page.
+
+    The header and every paragraph are separate text blocks, each followed
+    by a line holding a single line feed glyph. PyMuPDF drops blank lines
+    inside a block and, since 1.19, no longer separates blocks with one; the
+    extracted glyph puts the blank line where ``split_page`` splits back.
+    """
+    paragraphs = make_paragraphs(pages * paragraphs_per_page, seed=seed)
+    titles = make_paragraphs(pages, words_per_paragraph=3, seed=seed + 1)
+    pdf_document = fitz.open()
+    for page_num in range(pages):
+        page = pdf_document.new_page()
+        chunk = paragraphs[
+            page_num * paragraphs_per_page : (page_num + 1) * paragraphs_per_page
+        ]
+        top = 50
+        for block in [f"1.{page_num + 1} {titles[page_num][:-1]}"] + chunk:
+            rect = fitz.Rect(50, top, 545, 790)
+            spare = page.insert_textbox(rect, block, fontsize=8)
+            if spare < 0:
+                raise ValueError(f"{paragraphs_per_page} paragraphs overflow a page")
+            _end_block(pdf_document, page, rect.y1 - spare)
+            top = rect.y1 - spare + BLOCK_GAP
+    pdf_document.save(path)
+    pdf_document.close()
+    return path
+
+
+def _end_block(pdf_document, page, bottom):
+    # insert_textbox registers the font as /helv; PDF y grows upwards.
+    line = b"\nBT /helv 8 Tf 1 0 0 1 50 %.2f Tm <0a> Tj ET\n" % (
+        page.rect.height - bottom
+    )
+    xref = page.get_contents()[-1]
+    pdf_document.update_stream(xref, pdf_document.xref_stream(xref) + line)
+
+
+def make_pdfs(directory, files, pages, paragraphs_per_page=4, seed=0):
+    os.makedirs(directory, exist_ok=True)
+    return [
+        make_pdf(
+            os.path.join(directory, f"synthetic_{i}.pdf"),
+            pages,
+            paragraphs_per_page,
+            seed + i,
+        )
+        for i in range(files)
+    ]
+
+
+class UploadedPdf:
+    """File-like wrapper matching what Streamlit hands to ``PdfParser``."""
+
+    def __init__(self, path):
+        self.name = os.path.basename(path)
+        self._path = path
+
+    def getvalue(self):
+        with open(self._path, "rb") as f:
+            return f.read()
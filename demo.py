@@ -1,8 +1,9 @@
 import json
-import logging
 import os
 from parser.document_parser import PdfParser
+from parser.federated import FederatedSearcher, find_indexes
 from parser.indexer import TextIndexer
+from parser.server import SearchClient
 
 import faiss
 import streamlit as st
@@ -10,7 +11,7 @@ from dotenv import load_dotenv
 
 load_dotenv()
 
-from parser.utils import configure_logger
+from parser.utils import configure_logger, metrics
 
 log = configure_logger(__name__)
 
@@ -25,6 +26,22 @@ def read_json(file_path):
     return data
 
 
+def show_results(res):
+    log.info(f" RESUULTS: {res}")
+
+    for i, result in enumerate(res):
+        st.write(f"Result {i+1}: {result}")
+        if i < len(res) - 1:
+            st.markdown("---")
+
+
+@st.cache_resource(max_entries=1)
+def load_federated(index_versions):
+    # Keyed by (path, mtime) so rebuilt indexes are loaded again; otherwise
+    # loaded shards are kept between reruns.
+    return FederatedSearcher([path for path, _ in index_versions])
+
+
 st.title("Single PDF Parser and Search")
 st.write(
     "Upload one or more PDF files and click the button to parse them and dump the extracted data as JSON. "
@@ -66,13 +83,26 @@ if st.button("Build Index"):
         read_json(os.path.join(json_dir, json_file)) for json_file in json_files
     ]
 
-    all_texts = [doc["text"] for data in all_data for doc in data["documents"]]
-    indexer = TextIndexer(all_texts)
-    indexer.build_index()
-
-    if indexer:
-        indexer.save_index(index_name)
-        st.markdown("**:blue[ Faiss index has been built and stored at: tmp.index]**")
+    all_documents = [doc for data in all_data for doc in data["documents"]]
+    indexer = TextIndexer(
+        cache_dir=os.getenv("EMBEDDING_CACHE"),
+        index_spec=os.getenv("INDEX_SPEC", "Flat"),
+        compression=os.getenv("COMPRESSION"),
+    )
+    if os.path.exists(index_name):
+        indexer.load_index(index_name)
+    try:
+        added, removed = indexer.sync(all_documents)
+        log.info(f"Index updated: {added} paragraphs encoded, {removed} removed")
+        if indexer.data:
+            indexer.save_index(index_name)
+            st.markdown(
+                "**:blue[ Faiss index has been built and stored at: tmp.index]**"
+            )
+    except ValueError as err:
+        # E.g. too few paragraphs to train the IVF or PQ quantizers.
+        log.error(f"Could not build {index_name}: {err}")
+        st.error(f"Could not build the index: {err}")
 
 if st.sidebar.button("View Index"):
     files_indexer = faiss.read_index(index_name)
@@ -80,24 +110,56 @@ if st.sidebar.button("View Index"):
     dimensionality = files_indexer.d
     st.sidebar.write(f"Total Vectors: {n_vectors}, Dimensionality: {dimensionality}")
 
+# Stages timed with metrics.stage; profiling one runs it under cProfile.
+stages = ["parse_pdf", "encode", "index_add", "index_train", "index_search"]
+stages += ["rerank", "save_index", "load_index", "all"]
+profiled = st.sidebar.multiselect(
+    "Profile stages",
+    stages,
+    default=[stage for stage in stages if stage in metrics.profiled_stages],
+)
+metrics.set_profiling(profiled)
+if st.sidebar.button("Show profile"):
+    st.code(metrics.profile_report() or "Nothing profiled yet")
 
-single_index = [f for f in os.listdir(".") if f.endswith(".index")]
-selected_index_file = st.selectbox("Select a FAISS Index:", single_index)
 
+search_server = os.getenv("SEARCH_SERVER")
 
-if selected_index_file:
-    single_index = os.path.join(".", selected_index_file)
-    load_faiss_index = TextIndexer()
-    st.sidebar.write(selected_index_file)
-    st.write(f"Sucessfully loaded index: **{os.path.basename(single_index)}**")
-    load_faiss_index.load_index(single_index)
+if search_server:
+    # The search service keeps the model and index loaded between reruns.
+    client = SearchClient(search_server)
+    st.write(f"Searching the index served at **{search_server}**")
 
     query = st.text_input("Enter your query:")
     if st.button("Search"):
-        res = load_faiss_index.search(query)
-        logging.info(f" RESUULTS: {res}")
-
-        for i, result in enumerate(res):
-            st.write(f"Result {i+1}: {result}")
-            if i < len(res) - 1:
-                st.markdown("---")
+        show_results([result["text"] for result in client.search(query)])
+
+else:
+    single_index = [f for f in os.listdir(".") if f.endswith(".index")]
+    all_indexes = "All indexes"
+    selected_index_file = st.selectbox(
+        "Select a FAISS Index:", single_index + [all_indexes] if single_index else []
+    )
+
+    if selected_index_file == all_indexes:
+        index_files = find_indexes(".")
+        federated_index = load_federated(
+            tuple((path, os.path.getmtime(path)) for path in index_files)
+        )
+        st.write(f"Searching **{len(index_files)}** indexes")
+
+        query = st.text_input("Enter your query:")
+        if st.button("Search"):
+            res = federated_index.search_batch([query])[0]
+            show_results([f"{r['text']} ({os.path.basename(r['shard'])})" for r in res])
+
+    elif selected_index_file:
+        single_index = os.path.join(".", selected_index_file)
+        load_faiss_index = TextIndexer()
+        st.sidebar.write(selected_index_file)
+        st.write(f"Sucessfully loaded index: **{os.path.basename(single_index)}**")
+        load_faiss_index.load_index(single_index)
+
+        query = st.text_input("Enter your query:")
+        if st.button("Search"):
+            show_results(load_faiss_index.search(query))
@@ -1,15 +1,30 @@
 import json
-import logging
 import os
 import re
+from parser.utils import configure_logger, metrics
 
 import fitz
 from dotenv import load_dotenv
 
 load_dotenv()
 
+log = configure_logger(__name__)
 
-logging.basicConfig(level=logging.DEBUG)
+
+def split_page(text, filename):
+    """Split a page's text into header and paragraph entries."""
+    items = []
+    for paragraph in re.split("\n\n", text):
+        paragraph = paragraph.strip()
+        if not paragraph:
+            continue
+        if re.match(r"^\d+\.\d+\.\d+", paragraph):
+            items.append({"header": paragraph, "file": filename})
+        elif re.match(r"^\d+\.\d+", paragraph):
+            items.append({"header": paragraph, "file": filename})
+        else:
+            items.append({"text": paragraph, "file": filename})
+    return items
 
 
 class PdfParser:
@@ -24,33 +39,29 @@ class PdfParser:
             file_contents = uploaded_file.getvalue()
 
             try:
-                logging.debug(f"Parsing {filename}")
-                pdf_document = fitz.open(stream=file_contents, filetype="pdf")
-                for page_num in range(pdf_document.page_count):
-                    page = pdf_document[page_num]
-                    text = page.get_text()
-                    paragraphs = re.split("\n\n", text)
-                    for paragraph in paragraphs:
-                        paragraph = paragraph.strip()
-                        if not paragraph:
-                            continue
-                        if re.match("^\d+\.\d+\.\d+", paragraph):
-                            self.page_content.append(
-                                {"header": paragraph, "file": filename}
-                            )
-                        elif re.match("^\d+\.\d+", paragraph):
-                            self.page_content.append(
-                                {"header": paragraph, "file": filename}
-                            )
-                        else:
-                            self.document_content.append(
-                                {"text": paragraph, "file": filename}
-                            )
-                logging.debug(
-                    f"Extracted text length for {filename}: {[f for f in self.document_content]}"
+                log.debug(f"Parsing {filename}")
+                parsed = len(self.document_content)
+                with metrics.stage("parse_pdf"):
+                    pdf_document = fitz.open(stream=file_contents, filetype="pdf")
+                    header = None
+                    for page_num in range(pdf_document.page_count):
+                        page = pdf_document[page_num]
+                        for item in split_page(page.get_text(), filename):
+                            if "header" in item:
+                                header = item["header"]
+                                self.page_content.append(item)
+                            else:
+                                item["header"] = header
+                                self.document_content.append(item)
+                metrics.inc("pages_parsed", pdf_document.page_count)
+                parsed = len(self.document_content) - parsed
+                metrics.inc("paragraphs_parsed", parsed)
+                log.debug(
+                    f"Extracted {pdf_document.page_count} pages from {filename}, "
+                    f"{len(self.document_content)} paragraphs so far"
                 )
             except (fitz.PyMuPDFError, ValueError) as e:
-                logging.error(f"Failed to open or parse {filename}: {e}")
+                log.error(f"Failed to open or parse {filename}: {e}")
                 raise ValueError(f"Failed to open or parse {filename}: {e}")
 
     def write_json(self, output_filename):
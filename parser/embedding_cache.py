@@ -0,0 +1,244 @@
+import hashlib
+import json
+import os
+import re
+import threading
+import unicodedata
+from collections import OrderedDict
+from contextlib import contextmanager
+from parser.utils import configure_logger, metrics
+
+import numpy as np
+
+try:
+    import fcntl
+except ImportError:  # Windows
+    fcntl = None
+
+log = configure_logger(__name__)
+
+KEY_DTYPE = np.dtype([("key", "S20"), ("slot", "<i8")])
+
+
+def normalize_text(text):
+    text = unicodedata.normalize("NFKC", text)
+    return " ".join(text.split())
+
+
+class EmbeddingCache:
+    """On-disk embedding cache keyed by model name and normalized text hash.
+
+    Vectors live in a memory-mapped float32 matrix with ``max_entries`` rows,
+    and ``keys.npy`` maps text hashes to rows in least-recently-used order.
+    Once the matrix is full the least recently used row is overwritten.
+
+    Several processes may share a cache directory: writers hold an exclusive
+    ``fcntl`` lock while they merge ``keys.npy``, pick rows and write them,
+    and readers a shared one. Without ``fcntl`` (Windows) only one process
+    may use a directory at a time.
+    """
+
+    def __init__(self, cache_dir, model_name, max_entries=100000):
+        self.model_name = model_name
+        self.directory = os.path.join(
+            cache_dir, re.sub(r"[^A-Za-z0-9_.-]", "_", model_name)
+        )
+        self.max_entries = max_entries
+        self.dimension = None
+        self.hits = 0
+        self.misses = 0
+        self.deduplicated = 0
+        self.evictions = 0
+        self._entries = OrderedDict()
+        # Keys hit since keys.npy was last written, in recency order. Their
+        # recency is merged into the keys other processes saved meanwhile.
+        self._touched = OrderedDict()
+        self._keys_version = None
+        self._vectors = None
+        self._lock = threading.Lock()
+        with self._lock, self._file_lock(exclusive=False):
+            self._refresh()
+
+    @property
+    def _meta_path(self):
+        return os.path.join(self.directory, "meta.json")
+
+    @property
+    def _keys_path(self):
+        return os.path.join(self.directory, "keys.npy")
+
+    @property
+    def _vectors_path(self):
+        return os.path.join(self.directory, "vectors.f32")
+
+    @contextmanager
+    def _file_lock(self, exclusive):
+        os.makedirs(self.directory, exist_ok=True)
+        with open(os.path.join(self.directory, "lock"), "a") as f:
+            if fcntl is not None:
+                fcntl.flock(f, fcntl.LOCK_EX if exclusive else fcntl.LOCK_SH)
+            yield
+
+    def _refresh(self):
+        # Pick up the rows and keys other processes stored since keys.npy
+        # was last read or written. Runs under the file lock.
+        if self._vectors is None and os.path.exists(self._meta_path):
+            self._open()
+        try:
+            stat = os.stat(self._keys_path)
+        except FileNotFoundError:
+            return
+        version = (stat.st_ino, stat.st_mtime_ns, stat.st_size)
+        if version == self._keys_version:
+            return
+        entries = OrderedDict(
+            (bytes(key), int(slot)) for key, slot in np.load(self._keys_path)
+        )
+        for key in self._touched:
+            if key in entries:
+                entries.move_to_end(key)
+        self._entries = entries
+        self._keys_version = version
+
+    def _open(self):
+        with open(self._meta_path, "r") as f:
+            meta = json.load(f)
+        if meta["max_entries"] != self.max_entries:
+            log.info(
+                f"Embedding cache {self.directory} holds {meta['max_entries']} "
+                f"entries, ignoring max_entries={self.max_entries}"
+            )
+        self.max_entries = meta["max_entries"]
+        self.dimension = meta["dimension"]
+        self._vectors = np.memmap(
+            self._vectors_path,
+            dtype=np.float32,
+            mode="r+",
+            shape=(self.max_entries, self.dimension),
+        )
+
+    def _create(self, dimension):
+        self.dimension = dimension
+        self._vectors = np.memmap(
+            self._vectors_path,
+            dtype=np.float32,
+            mode="w+",
+            shape=(self.max_entries, dimension),
+        )
+        with open(self._meta_path, "w") as f:
+            json.dump(
+                {
+                    "model_name": self.model_name,
+                    "dimension": dimension,
+                    "max_entries": self.max_entries,
+                },
+                f,
+            )
+
+    def key(self, text):
+        normalized = normalize_text(text)
+        return hashlib.sha1(f"{self.model_name}\0{normalized}".encode("utf-8")).digest()
+
+    def encode(self, texts, encode_fn):
+        """Return vectors for ``texts``, calling ``encode_fn`` on cache misses.
+
+        Identical texts within the batch are encoded once.
+        """
+        keys = [self.key(text) for text in texts]
+        first = {}
+        for i, key in enumerate(keys):
+            first.setdefault(key, i)
+
+        found = {}
+        # The shared file lock keeps other processes from reusing a row
+        # between looking up its key and reading it.
+        with self._lock, self._file_lock(exclusive=False):
+            self._refresh()
+            for key in first:
+                slot = self._entries.get(key)
+                if slot is not None:
+                    self._entries.move_to_end(key)
+                    self._touched.pop(key, None)
+                    self._touched[key] = None
+                    found[key] = np.array(self._vectors[slot])
+            missing = [key for key in first if key not in found]
+            self.hits += len(found)
+            self.misses += len(missing)
+            self.deduplicated += len(keys) - len(first)
+        metrics.inc("embedding_cache_hits", len(found))
+        metrics.inc("embedding_cache_misses", len(missing))
+
+        if missing:
+            encoded = np.asarray(
+                encode_fn([texts[first[key]] for key in missing]), dtype=np.float32
+            )
+            found.update(zip(missing, encoded))
+            # Slots are picked from the keys on disk, not this instance's
+            # possibly stale view, or two processes could fill the same row.
+            with self._lock, self._file_lock(exclusive=True):
+                self._refresh()
+                self._store(missing, encoded)
+                self._flush()
+
+        return np.stack([found[key] for key in keys])
+
+    def _store(self, keys, vectors):
+        if self._vectors is None:
+            self._create(vectors.shape[1])
+        # A batch larger than the cache only keeps its tail.
+        start = max(0, len(keys) - self.max_entries)
+        added = OrderedDict()
+        evicted = False
+        for key, vector in zip(keys[start:], vectors[start:]):
+            if key in self._entries:
+                # Stored by another thread meanwhile, same key same vector.
+                self._entries.move_to_end(key)
+                self._vectors[self._entries[key]] = vector
+                continue
+            if len(self._entries) + len(added) < self.max_entries:
+                slot = len(self._entries) + len(added)
+            else:
+                _, slot = self._entries.popitem(last=False)
+                evicted = True
+                self.evictions += 1
+                metrics.inc("embedding_cache_evictions")
+            added[key] = (slot, vector)
+        if evicted:
+            # Forget the evicted keys on disk before their rows are
+            # overwritten, so a crash in between cannot leave a key
+            # pointing at another text's vector.
+            self._save_keys()
+        for key, (slot, vector) in added.items():
+            self._vectors[slot] = vector
+            self._entries[key] = slot
+
+    def _flush(self):
+        self._vectors.flush()
+        self._save_keys()
+
+    def _save_keys(self):
+        # Write a new file and swap it in, a truncated keys.npy would make
+        # the whole cache unreadable.
+        index = np.array(list(self._entries.items()), dtype=KEY_DTYPE)
+        with open(self._keys_path + ".tmp", "wb") as f:
+            np.save(f, index)
+        os.replace(self._keys_path + ".tmp", self._keys_path)
+        stat = os.stat(self._keys_path)
+        self._keys_version = (stat.st_ino, stat.st_mtime_ns, stat.st_size)
+        self._touched.clear()
+
+    def flush(self):
+        with self._lock, self._file_lock(exclusive=True):
+            self._refresh()
+            if self._vectors is not None:
+                self._flush()
+
+    def stats(self):
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "deduplicated": self.deduplicated,
+            "evictions": self.evictions,
+            "entries": len(self._entries),
+            "max_entries": self.max_entries,
+        }
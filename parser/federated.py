@@ -0,0 +1,130 @@
+import heapq
+import os
+import threading
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from parser.indexer import TextIndexer
+from parser.utils import configure_logger, metrics
+
+import faiss
+import numpy as np
+
+log = configure_logger(__name__)
+
+
+def find_indexes(directory, suffix=".index"):
+    return sorted(
+        os.path.join(directory, f) for f in os.listdir(directory) if f.endswith(suffix)
+    )
+
+
+class FederatedSearcher:
+    """Search a set of indexes saved by ``TextIndexer.save_index`` as one.
+
+    The query is encoded once and every shard is searched in its own thread
+    (FAISS releases the GIL). The per-shard top-k lists are merged by score.
+    Shards are loaded on first use and the least recently used ones are
+    dropped once the bytes they keep in memory, as estimated by
+    ``TextIndexer.memory_usage``, exceed ``memory_budget``. Memory-mapped
+    stores and indexes count little, legacy JSON shards count in full.
+    """
+
+    def __init__(
+        self,
+        index_paths,
+        model_name="paraphrase-mpnet-base-v2",
+        cache_dir=None,
+        encoder=None,
+        memory_budget=None,
+        max_workers=8,
+    ):
+        self.index_paths = list(index_paths)
+        self.memory_budget = memory_budget
+        # Encodes queries; its encoder is shared with every shard.
+        self.query_indexer = TextIndexer(
+            model_name=model_name, cache_dir=cache_dir, encoder=encoder
+        )
+        self.loads = 0
+        self.evictions = 0
+        self._shards = OrderedDict()
+        self._sizes = {}
+        self._lock = threading.Lock()
+        self._executor = ThreadPoolExecutor(max_workers)
+
+    def search(self, search_text, top_k=2):
+        results = self.search_batch([search_text], top_k)[0]
+        return [result["text"] for result in results]
+
+    def search_batch(self, queries, top_k=2):
+        """Like ``TextIndexer.search_batch``, each result also names its ``shard``."""
+        if not queries:
+            return []
+        vectors = np.ascontiguousarray(
+            self.query_indexer.generate_encodings(list(queries)), dtype=np.float32
+        )
+        faiss.normalize_L2(vectors)
+
+        def search_shard(path):
+            results = self._shard(path).search_vectors(vectors, top_k)
+            for query_results in results:
+                for result in query_results:
+                    result["shard"] = path
+            return results
+
+        per_shard = list(self._executor.map(search_shard, self.index_paths))
+        return [
+            heapq.nlargest(
+                top_k,
+                (result for results in per_shard for result in results[row]),
+                key=lambda result: result["score"],
+            )
+            for row in range(len(queries))
+        ]
+
+    def _shard(self, path):
+        with self._lock:
+            if path in self._shards:
+                self._shards.move_to_end(path)
+                return self._shards[path]
+
+        shard = TextIndexer(
+            model_name=self.query_indexer.model_name,
+            encoder=self.query_indexer.encoder,
+        )
+        shard.load_index(path)
+
+        with self._lock:
+            if path in self._shards:
+                return self._shards[path]
+            self._shards[path] = shard
+            self._sizes[path] = shard.memory_usage()
+            self.loads += 1
+            metrics.inc("shard_loads")
+            self._evict()
+        return shard
+
+    def _evict(self):
+        if self.memory_budget is None:
+            return
+        # Never evict the most recently used shard, even if it alone is over.
+        while len(self._shards) > 1 and self.memory_usage() > self.memory_budget:
+            path, _ = self._shards.popitem(last=False)
+            del self._sizes[path]
+            self.evictions += 1
+            metrics.inc("shard_evictions")
+            log.debug(f"Evicted shard {path}")
+
+    def memory_usage(self):
+        return sum(self._sizes.values())
+
+    def stats(self):
+        return {
+            "shards": len(self.index_paths),
+            "loaded": len(self._shards),
+            "memory_usage": self.memory_usage(),
+            "loads": self.loads,
+            "evictions": self.evictions,
+        }
+
+    def close(self):
+        self._executor.shutdown()
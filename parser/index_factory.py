@@ -0,0 +1,219 @@
+import re
+import time
+from parser.utils import configure_logger
+
+import faiss
+import numpy as np
+
+log = configure_logger(__name__)
+
+
+def make_index(spec, dimension):
+    """Create an empty index from a FAISS factory string.
+
+    Supported specs are ``"Flat"``, ``"IVF<nlist>,Flat"``, ``"HNSW<M>"`` and
+    ``"IVF<nlist>,PQ<m>"``. IVF indexes store paragraph ids natively, every
+    other index type is wrapped in an ``IndexIDMap``. Unlike ``IndexIDMap2``
+    it keeps no reverse map, which FAISS rebuilds on every load.
+    """
+    index = faiss.index_factory(dimension, spec)
+    if spec.startswith("IVF"):
+        return index
+    return faiss.IndexIDMap(index)
+
+
+CODECS = {"fp16": "SQfp16", "int8": "SQ8"}
+
+
+def compressed_spec(spec, compression):
+    """Swap the vector storage of ``spec`` for a compressed codec.
+
+    ``compression`` is ``"fp16"`` or ``"int8"`` for scalar quantization or
+    ``"pq<m>"`` for product quantization into ``m`` bytes per vector, e.g.
+    ``compressed_spec("IVF1024,Flat", "int8") == "IVF1024,SQ8"``.
+    """
+    if not compression:
+        return spec
+    match = re.fullmatch(r"pq(\d+)", compression)
+    if compression in CODECS:
+        codec = CODECS[compression]
+    elif match:
+        codec = f"PQ{match.group(1)}"
+    else:
+        raise ValueError(f"Unknown compression {compression!r}")
+    coarse = spec.split(",")[0]
+    if coarse == "Flat":
+        return codec
+    return f"{coarse},{codec}"
+
+
+def supports_remove(spec):
+    return not spec.startswith("HNSW")
+
+
+# FAISS warns when k-means gets fewer points than this per centroid.
+MIN_POINTS_PER_CENTROID = 39
+
+
+def _nlist(index):
+    try:
+        return faiss.extract_index_ivf(index).nlist
+    except RuntimeError:
+        return 1
+
+
+def _pq_centroids(index):
+    # Centroids per product quantizer codebook, 0 for indexes without PQ.
+    if isinstance(index, faiss.IndexIDMap):
+        index = index.index
+    try:
+        index = faiss.extract_index_ivf(index)
+    except RuntimeError:
+        pass
+    pq = getattr(faiss.downcast_index(index), "pq", None)
+    return pq.ksub if pq is not None else 0
+
+
+def index_memory_usage(index, mapped=False):
+    """Estimate the bytes ``index`` keeps in process memory.
+
+    With ``mapped`` the vector codes (or IVF inverted lists) are
+    memory-mapped and only the id map, coarse quantizer and HNSW graph are
+    counted. Training state such as PQ codebooks is ignored.
+    """
+    size = 0
+    if isinstance(index, faiss.IndexIDMap):
+        size += index.id_map.size() * 8
+        index = index.index
+    index = faiss.downcast_index(index)
+    if isinstance(index, faiss.IndexIVF):
+        size += index_memory_usage(index.quantizer)
+        if not mapped:
+            # Each inverted list entry stores its code and an 8-byte id.
+            size += index.ntotal * (index.code_size + 8)
+    elif isinstance(index, faiss.IndexHNSW):
+        size += index.hnsw.neighbors.size() * 4 + index.hnsw.offsets.size() * 8
+        if not mapped:
+            size += index.ntotal * faiss.downcast_index(index.storage).code_size
+    elif not mapped:
+        size += index.ntotal * index.code_size
+    return size
+
+
+def training_size(index):
+    """Vectors to collect before training ``index``, 0 if it needs no training."""
+    if index.is_trained:
+        return 0
+    # Quantizer codebooks have up to 256 centroids each.
+    return MIN_POINTS_PER_CENTROID * max(_nlist(index), 256)
+
+
+def train_index(index, vectors, max_training_points=None, seed=0):
+    if index.is_trained:
+        return
+    nlist = _nlist(index)
+    if len(vectors) < nlist:
+        raise ValueError(
+            f"Need at least {nlist} vectors to train an index with {nlist} lists, "
+            f"got {len(vectors)}"
+        )
+    centroids = _pq_centroids(index)
+    if len(vectors) < centroids:
+        raise ValueError(
+            f"Need at least {centroids} vectors to train a product quantizer, "
+            f"got {len(vectors)}; use int8 or fp16 compression for small indexes"
+        )
+    if max_training_points is None:
+        # Quantizer codebooks have up to 256 centroids each.
+        max_training_points = 256 * max(nlist, 256)
+    sample = vectors
+    if len(vectors) > max_training_points:
+        rng = np.random.default_rng(seed)
+        rows = rng.choice(len(vectors), max_training_points, replace=False)
+        sample = np.ascontiguousarray(vectors[np.sort(rows)])
+    log.debug(f"Training index on {len(sample)} vectors")
+    index.train(sample)
+
+
+def set_search_params(index, params):
+    space = faiss.ParameterSpace()
+    for name, value in params.items():
+        space.set_index_parameter(index, name, value)
+
+
+def default_candidates(spec):
+    match = re.match(r"IVF(\d+)", spec)
+    if match:
+        nlist = int(match.group(1))
+        nprobes = [2**i for i in range(nlist.bit_length()) if 2**i <= nlist]
+        return [{"nprobe": n} for n in nprobes]
+    if spec.startswith("HNSW"):
+        return [{"efSearch": ef} for ef in (16, 32, 64, 128, 256, 512)]
+    return [{}]
+
+
+def recall_at_k(found, expected):
+    k = expected.shape[1]
+    hits = [
+        len(set(row[row >= 0]) & set(truth[truth >= 0]))
+        for row, truth in zip(found, expected)
+    ]
+    return float(np.mean(hits)) / k
+
+
+def tune_search_params(
+    index,
+    vectors,
+    ids,
+    queries,
+    k=10,
+    target_recall=0.95,
+    candidates=None,
+    search=None,
+):
+    """Pick the cheapest search setting whose recall@k reaches ``target_recall``.
+
+    ``candidates`` are tried in order of increasing cost and the first one
+    that reaches the target wins; a single timed pass is too noisy to rank
+    settings by latency. Recall is measured against an exact flat index over
+    ``vectors`` (labelled with ``ids``) on the held-out ``queries``.
+    ``search(queries, k)``, which returns the found labels, replaces
+    ``index.search`` when searches do more than query the index, e.g.
+    re-rank. Returns a report with the chosen ``params``, its ``recall`` and
+    ``latency_ms`` and every trial.
+    """
+    exact = faiss.IndexFlatL2(vectors.shape[1])
+    exact.add(vectors)
+    _, truth = exact.search(queries, k)
+    ids = np.asarray(ids, dtype=np.int64)
+    expected = np.where(truth >= 0, ids[truth], -1)
+
+    trials = []
+    for params in candidates or [{}]:
+        set_search_params(index, params)
+        start = time.perf_counter()
+        if search is None:
+            _, found = index.search(queries, k)
+        else:
+            found = search(queries, k)
+        latency_ms = (time.perf_counter() - start) * 1000 / len(queries)
+        trials.append(
+            {
+                "params": params,
+                "recall": recall_at_k(found, expected),
+                "latency_ms": latency_ms,
+            }
+        )
+        log.debug(f"Tuning trial: {trials[-1]}")
+        if trials[-1]["recall"] >= target_recall:
+            break
+
+    best = trials[-1]
+    if best["recall"] < target_recall:
+        best = max(trials, key=lambda t: t["recall"])
+        log.warning(
+            f"No setting reached recall@{k} >= {target_recall}, "
+            f"using {best['params']} with recall {best['recall']:.3f}"
+        )
+    set_search_params(index, best["params"])
+    return dict(best, trials=trials)
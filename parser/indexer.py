@@ -1,6 +1,22 @@
+import hashlib
 import json
-import logging
 import os
+import shutil
+import sys
+from parser.embedding_cache import EmbeddingCache
+from parser.index_factory import (
+    compressed_spec,
+    default_candidates,
+    index_memory_usage,
+    make_index,
+    set_search_params,
+    supports_remove,
+    train_index,
+    training_size,
+    tune_search_params,
+)
+from parser.paragraph_store import IdSet, ParagraphStore, ParagraphStoreWriter
+from parser.utils import SIZE_BUCKETS, configure_logger, metrics
 
 import faiss
 import numpy as np
@@ -9,57 +25,770 @@ from sentence_transformers import SentenceTransformer
 
 load_dotenv()
 
+log = configure_logger(__name__)
 
-logging.basicConfig(level=logging.DEBUG)
+DEFAULT_RERANK_FACTOR = 4
+
+
+def paragraph_id(filename, text):
+    """Stable 63-bit id for a paragraph, keyed by its file and content hash."""
+    content_hash = hashlib.sha1(text.encode("utf-8")).hexdigest()
+    key = f"{filename or ''}\0{content_hash}".encode("utf-8")
+    digest = hashlib.sha1(key).digest()
+    return int.from_bytes(digest[:8], "big") & 0x7FFFFFFFFFFFFFFF
+
+
+def _list_bytes(values):
+    # A list's pointers plus each distinct object it references once.
+    unique = {id(value): value for value in values}
+    return sys.getsizeof(values) + sum(map(sys.getsizeof, unique.values()))
 
 
 class TextIndexer:
-    def __init__(self, data=None, model_name="paraphrase-mpnet-base-v2"):
+    def __init__(
+        self,
+        data=None,
+        model_name="paraphrase-mpnet-base-v2",
+        cache_dir=None,
+        index_spec="Flat",
+        search_params=None,
+        encoder=None,
+        compression=None,
+        rerank_factor=None,
+    ):
 
         self.data = data
-        self.encoder = SentenceTransformer(model_name)
+        # Any object with a SentenceTransformer-style ``encode(texts)``.
+        self.encoder = encoder or SentenceTransformer(model_name)
         self.model_name = model_name
+        self.cache = EmbeddingCache(cache_dir, model_name) if cache_dir else None
+        self.index = None
+        self.index_spec = index_spec
+        self.search_params = dict(search_params or {})
+        # With compression the index holds quantized vectors and the top
+        # ``top_k * rerank_factor`` candidates are re-scored against the
+        # full-precision vectors, kept as chunks aligned with self.data.
+        # An explicit ``rerank_factor`` overrides the one saved with an index;
+        # None uses the saved one, or DEFAULT_RERANK_FACTOR.
+        self.compression = compression
+        self.rerank_factor = rerank_factor
+        self._vector_chunks = []
+        # ``(vectors, ids)`` chunks encoded before the index exists. Indexes
+        # that need training are only created once enough vectors arrived.
+        self._pending = []
+        # Paragraph ids, source files and section headers, aligned with
+        # self.data. ``ids`` is None for indexes saved without a manifest,
+        # whose FAISS labels are plain positions into self.data. After
+        # load_index these are read-only views of the paragraph store.
+        self.ids = []
+        self.files = []
+        self.headers = []
+        self._known = None
+        self._lookup = None
+        self._index_path = None
+        self._read_only = False
+        # Store writer that added paragraphs go to, see ``stream_to``.
+        self._stream = None
+        self._stream_path = None
+        self._stream_version = None
 
     def generate_encodings(self, text_list):
         if not text_list:
-            logging.warning("The text list is empty.")
+            log.warning("The text list is empty.")
             return np.array([])
-        vectors = self.encoder.encode(text_list)
+        metrics.inc("paragraphs_encoded", len(text_list))
+        metrics.observe("encoder_batch_size", len(text_list), SIZE_BUCKETS)
+        with metrics.stage("encode"):
+            if self.cache is None:
+                return self.encoder.encode(text_list)
+            vectors = self.cache.encode(text_list, self.encoder.encode)
+        log.debug(f"Embedding cache: {self.cache.stats()}")
         return vectors
 
-    def build_index(self):
+    def build_index(
+        self, index_spec=None, search_params=None, compression=None, rerank_factor=None
+    ):
+        """Build a new index over self.data.
+
+        ``index_spec`` is a FAISS factory string (see ``make_index``);
+        ``search_params`` such as ``nprobe`` or ``efSearch`` are saved with
+        the index. ``compression`` (``"fp16"``, ``"int8"`` or ``"pq<m>"``, see
+        ``compressed_spec``) stores quantized vectors in the index and
+        re-ranks ``top_k * rerank_factor`` candidates exactly.
+        """
+        if index_spec is not None:
+            self.index_spec = index_spec
+        if search_params is not None:
+            self.search_params = dict(search_params)
+        if compression is not None:
+            self.compression = compression
+        if rerank_factor is not None:
+            self.rerank_factor = rerank_factor
+        self._check_not_streaming()
+        if len(self.files) == len(self.headers) == len(self.data):
+            rows = zip(self.data, self.files, self.headers)
+        else:
+            # self.data was assigned directly, without files or headers.
+            rows = ((doc, None, None) for doc in self.data)
+        documents = [
+            (
+                doc
+                if isinstance(doc, dict)
+                else {"text": doc, "file": file, "header": header}
+            )
+            for doc, file, header in rows
+        ]
+        self.index = None
+        self.data = []
+        self.ids = []
+        self.files = []
+        self.headers = []
+        self._vector_chunks = []
+        self._pending = []
+        self._read_only = False
+        self._invalidate()
+        self.add_documents(documents)
+        self._build_pending()
+
+    def add_documents(self, documents):
+        """Encode and index ``{"text", "file", "header"}`` documents not indexed yet.
+
+        Paragraphs are identified by file and content, so re-adding a file
+        only encodes its new or changed paragraphs and identical paragraphs
+        within one file are indexed once. Indexes that need training buffer
+        the vectors until about ``training_size`` have been added, or until
+        the index is searched or saved. Returns the number of vectors added.
+        """
+        self._prepare_update(adding=True)
+        documents = list(documents)
+        pids = [paragraph_id(doc.get("file"), doc["text"]) for doc in documents]
+        indexed = self._known_ids().contains(pids)
+        new_ids, new_texts, new_files, new_headers = [], [], [], []
+        seen = set()
+        for doc, pid, known in zip(documents, pids, indexed):
+            if known or pid in seen:
+                continue
+            seen.add(pid)
+            new_ids.append(pid)
+            new_texts.append(doc["text"])
+            new_files.append(doc.get("file"))
+            new_headers.append(doc.get("header"))
+        if not new_texts:
+            return 0
 
-        vectors = self.generate_encodings(self.data)
-        vector_dimension = vectors.shape[1]
-        self.index = faiss.IndexFlatL2(vector_dimension)
+        vectors = np.ascontiguousarray(
+            self.generate_encodings(new_texts), dtype=np.float32
+        )
         faiss.normalize_L2(vectors)
-        self.index.add(vectors)
+        if self.index is None:
+            self._pending.append((vectors, np.array(new_ids, dtype=np.int64)))
+            self._build_pending(force=False)
+        else:
+            with metrics.stage("index_add"):
+                self.index.add_with_ids(vectors, np.array(new_ids, dtype=np.int64))
+        metrics.inc("vectors_added", len(new_ids))
+
+        if self._stream is not None:
+            self._stream.append(new_texts, new_ids, new_files, new_headers)
+            if self.compression:
+                self._stream.append_vectors(vectors)
+        else:
+            if self.compression:
+                self._vector_chunks.append(vectors)
+            # Extend in place so adding many small batches stays linear.
+            if self.data is None:
+                self.data = []
+            self.data.extend(new_texts)
+            self.ids.extend(new_ids)
+            self.files.extend(new_files)
+            self.headers.extend(new_headers)
+            self._lookup = None
+        self._known_ids().add(new_ids)
+        log.debug(f"Added {len(new_texts)} paragraphs to the index")
+        return len(new_texts)
+
+    def _build_pending(self, force=True):
+        # Create the index from the buffered vectors, unless it needs more
+        # of them for training and ``force`` is false.
+        if self.index is not None or not self._pending:
+            return
+        index = make_index(self._faiss_spec(), self._pending[0][0].shape[1])
+        buffered = sum(len(ids) for _, ids in self._pending)
+        if not force and buffered < training_size(index):
+            return
+        vectors = np.concatenate([vectors for vectors, _ in self._pending])
+        ids = np.concatenate([ids for _, ids in self._pending])
+        with metrics.stage("index_train"):
+            train_index(index, vectors)
+        set_search_params(index, self.search_params)
+        with metrics.stage("index_add"):
+            index.add_with_ids(vectors, ids)
+        self.index = index
+        self._pending = []
+
+    def remove_file(self, filename):
+        """Drop every paragraph of ``filename``. Returns the number removed."""
+        self._prepare_update()
+        stale = [pid for pid, f in zip(self.ids, self.files) if f == filename]
+        self._remove_ids(stale)
+        return len(stale)
+
+    def update_file(self, filename, documents):
+        """Re-index ``filename`` from its current documents.
+
+        Vectors of paragraphs that disappeared are removed and only new or
+        changed paragraphs are encoded. Returns ``(added, removed)``.
+        """
+        self._prepare_update()
+        documents = [dict(doc, file=filename) for doc in documents]
+        wanted = {paragraph_id(filename, doc["text"]) for doc in documents}
+        stale = [
+            pid
+            for pid, f in zip(self.ids, self.files)
+            if f == filename and pid not in wanted
+        ]
+        self._remove_ids(stale)
+        added = self.add_documents(documents)
+        return added, len(stale)
+
+    def sync(self, documents):
+        """Bring the index in line with the full set of ``documents``.
+
+        Paragraphs no longer present, including those of dropped files, are
+        removed and all new ones are added in one ``add_documents`` call.
+        Returns ``(added, removed)``.
+        """
+        self._prepare_update()
+        wanted = {paragraph_id(doc.get("file"), doc["text"]) for doc in documents}
+        stale = [pid for pid in self.ids if pid not in wanted]
+        self._remove_ids(stale)
+        added = self.add_documents(documents)
+        removed = len(stale)
+        log.info(f"Index sync: {added} paragraphs added, {removed} removed")
+        return added, removed
+
+    def _remove_ids(self, ids):
+        if not ids:
+            return
+        drop = set(ids)
+        keep = [i for i, pid in enumerate(self.ids) if pid not in drop]
+        if self.compression:
+            self._vector_chunks = [self._full_vectors()[keep]]
+        if self.index is None:
+            # Nothing is indexed yet, the buffer is aligned with self.ids.
+            vectors = np.concatenate([vectors for vectors, _ in self._pending])
+            kept_ids = np.array([self.ids[i] for i in keep], dtype=np.int64)
+            self._pending = [(vectors[keep], kept_ids)] if keep else []
+        elif supports_remove(self.index_spec):
+            self.index.remove_ids(np.array(ids, dtype=np.int64))
+        else:
+            # Graph indexes cannot delete vectors, rebuild from the rest.
+            if self.compression:
+                vectors = self._vector_chunks[0]
+            else:
+                vectors = self._reconstruct([self.ids[i] for i in keep])
+            index = make_index(self._faiss_spec(), self.index.d)
+            train_index(index, vectors)
+            index.add_with_ids(
+                vectors, np.array([self.ids[i] for i in keep], dtype=np.int64)
+            )
+            set_search_params(index, self.search_params)
+            self.index = index
+        self.data = [self.data[i] for i in keep]
+        self.ids = [self.ids[i] for i in keep]
+        self.files = [self.files[i] for i in keep]
+        self.headers = [self.headers[i] for i in keep]
+        self._invalidate()
+
+    def _faiss_spec(self):
+        return compressed_spec(self.index_spec, self.compression)
+
+    def _full_vectors(self):
+        # Concatenate lazily so streaming many small batches stays linear.
+        if len(self._vector_chunks) > 1:
+            self._vector_chunks = [np.concatenate(self._vector_chunks)]
+        if not self._vector_chunks:
+            return np.empty((0, self.index.d), dtype=np.float32)
+        return self._vector_chunks[0]
+
+    def _reconstruct(self, ids):
+        # IndexIDMap cannot reconstruct by id, find the rows in its id_map.
+        id_map = faiss.vector_to_array(self.index.id_map)
+        order = np.argsort(id_map)
+        rows = order[np.searchsorted(id_map, ids, sorter=order)]
+        return self.index.index.reconstruct_n(0, self.index.ntotal)[rows]
+
+    def set_search_params(self, **params):
+        self.search_params.update(params)
+        self._build_pending()
+        set_search_params(self.index, self.search_params)
+
+    def tune_search_params(
+        self, queries, k=10, target_recall=0.95, candidates=None, vectors=None
+    ):
+        """Choose the cheapest search parameters reaching ``target_recall``.
+
+        ``queries`` are held-out query strings. The exact reference index is
+        built from ``vectors`` aligned with self.data, re-encoded when not
+        given. The chosen parameters are applied and saved with the index.
+        """
+        self._check_not_streaming()
+        self._build_pending()
+        if vectors is None and self.compression:
+            vectors = np.ascontiguousarray(self._full_vectors())
+        elif vectors is None:
+            vectors = np.ascontiguousarray(
+                self.generate_encodings(list(self.data)), dtype=np.float32
+            )
+            faiss.normalize_L2(vectors)
+        query_vectors = np.ascontiguousarray(
+            self.generate_encodings(list(queries)), dtype=np.float32
+        )
+        faiss.normalize_L2(query_vectors)
+        ids = self.ids if self.ids is not None else range(len(self.data))
+        report = tune_search_params(
+            self.index,
+            vectors,
+            list(ids),
+            query_vectors,
+            k=k,
+            target_recall=target_recall,
+            candidates=candidates or default_candidates(self.index_spec),
+            # Recall of the quantized index alone understates what searches
+            # return after re-ranking, so measure through search_vectors.
+            search=self._search_labels if self.compression else None,
+        )
+        self.search_params = dict(report["params"])
+        log.info(
+            f"Tuned {self.index_spec}: {self.search_params}, "
+            f"recall@{k}={report['recall']:.3f}, {report['latency_ms']:.3f} ms/query"
+        )
+        return report
+
+    def _search_labels(self, vectors, k):
+        results = self.search_vectors(vectors, k)
+        labels = np.full((len(results), k), -1, dtype=np.int64)
+        for row, row_results in enumerate(results):
+            labels[row, : len(row_results)] = [result["id"] for result in row_results]
+        return labels
+
+    def _id_lookup(self):
+        if self._lookup is None:
+            ids = np.array(self.ids, dtype=np.int64)
+            order = np.argsort(ids, kind="stable")
+            self._lookup = ids[order], order
+        return self._lookup
+
+    def _invalidate(self):
+        self._known = None
+        self._lookup = None
+
+    def _known_ids(self):
+        if self._known is None:
+            self._known = IdSet(self.ids)
+        return self._known
+
+    def _check_not_streaming(self):
+        if self._stream is not None:
+            raise RuntimeError(
+                f"Only add_documents can run while streaming to "
+                f"{self._stream_path}, call save_index first"
+            )
+
+    def _writable_index(self):
+        # Memory-mapped indexes are read-only, read the file into memory.
+        if self._index_path is not None:
+            self.index = faiss.read_index(self._index_path)
+            set_search_params(self.index, self.search_params)
+            self._index_path = None
+
+    def _prepare_update(self, adding=False):
+        # Loaded paragraphs are memory-mapped and the index may be too, copy
+        # both into memory before changing them. While streaming, added
+        # paragraphs go to the store writer instead.
+        if not adding:
+            self._check_not_streaming()
+        self._writable_index()
+        if self._read_only:
+            self.data = list(self.data)
+            if self.ids is not None:
+                self.ids = self.ids.tolist()
+            self.files = list(self.files)
+            self.headers = list(self.headers)
+            self._read_only = False
+            self._invalidate()
+        self._ensure_id_map()
+
+    def _ensure_id_map(self):
+        # Indexes saved before manifests existed are plain flat indexes
+        # labelled by position. Re-key them by paragraph id, dropping
+        # duplicate paragraphs, so they can be updated incrementally.
+        if self.ids is not None:
+            return
+        vectors = self.index.reconstruct_n(0, self.index.ntotal)
+        keep, ids, seen = [], [], set()
+        for pos, text in enumerate(self.data):
+            pid = paragraph_id(None, text)
+            if pid not in seen:
+                seen.add(pid)
+                keep.append(pos)
+                ids.append(pid)
+        self.index_spec = "Flat"
+        self.index = make_index(self.index_spec, self.index.d)
+        self.index.add_with_ids(
+            np.ascontiguousarray(vectors[keep]), np.array(ids, dtype=np.int64)
+        )
+        self.data = [self.data[pos] for pos in keep]
+        self.ids = ids
+        self.files = [None] * len(ids)
+        self.headers = [None] * len(ids)
+        self._invalidate()
+
+    def stream_to(self, file_path):
+        """Write documents added from now on straight to a new store of ``file_path``.
+
+        Paragraphs, their columns and, with compression, the full vectors go
+        to disk batch by batch instead of staying in memory, so only the
+        FAISS index and 8 bytes per paragraph id grow with the corpus.
+        Paragraphs indexed so far are copied over first. Until
+        ``save_index(file_path)`` completes the store, ``add_documents`` is
+        the only update and searches are unavailable.
+        """
+        self._check_not_streaming()
+        self._ensure_id_map()
+        self._writable_index()
+        writer, version = self._store_writer(file_path)
+        self._write_paragraphs(writer)
+        self._known_ids()
+        self.data, self.ids, self.files, self.headers = [], [], [], []
+        self._vector_chunks = []
+        self._lookup = None
+        self._read_only = False
+        self._stream = writer
+        self._stream_path = file_path
+        self._stream_version = version
 
     def save_index(self, file_path):
-        faiss.write_index(self.index, file_path)
-        # Also save the original text data
-        data_file_path = os.path.join(file_path + "_paragraphs.json")
-        with open(data_file_path, "w") as f:
-            json.dump(self.data, f)
-
-    def load_index(self, file_path):
-        self.index = faiss.read_index(file_path)
-        # Load the original text data
+        with metrics.stage("save_index"):
+            self._save_index(file_path)
+
+    def _save_index(self, file_path):
+        if self._stream is not None:
+            self._finish_stream(file_path)
+            return
+        self._ensure_id_map()
+        self._writable_index()
+        self._build_pending()
+        writer, version = self._store_writer(file_path)
+        self._write_paragraphs(writer)
+        writer.close()
+        self._write_index(file_path, version)
+
+    def _finish_stream(self, file_path):
+        if file_path != self._stream_path:
+            raise ValueError(f"Streaming to {self._stream_path}, not {file_path}")
+        self._build_pending()
+        writer, self._stream = self._stream, None
+        writer.close()
+        if self.index is None:
+            shutil.rmtree(writer.directory, ignore_errors=True)
+            log.warning(f"No paragraphs were added, nothing saved at {file_path}")
+            return
+        manifest = self._write_index(file_path, self._stream_version)
+        self._open_store(os.path.dirname(file_path), manifest)
+
+    @staticmethod
+    def _store_name(file_path, version):
+        return f"{os.path.basename(file_path)}_store.{version}"
+
+    def _store_writer(self, file_path):
+        version = self._read_manifest(file_path).get("version", 0) + 1
+        store_path = os.path.join(
+            os.path.dirname(file_path), self._store_name(file_path, version)
+        )
+        shutil.rmtree(store_path, ignore_errors=True)
+        return ParagraphStoreWriter(store_path), version
+
+    def _write_paragraphs(self, writer, chunk_size=65536):
+        # Copy chunk by chunk, so memory-mapped columns and vectors are
+        # never read into memory all at once.
+        for start in range(0, len(self.ids), chunk_size):
+            rows = range(start, min(start + chunk_size, len(self.ids)))
+            writer.append(
+                [self.data[i] for i in rows],
+                self.ids[start : start + chunk_size],
+                [self.files[i] for i in rows],
+                [self.headers[i] for i in rows],
+            )
+        for chunk in self._vector_chunks:
+            for start in range(0, len(chunk), chunk_size):
+                writer.append_vectors(chunk[start : start + chunk_size])
+
+    def _write_index(self, file_path, version):
+        # Other processes may have the saved files memory-mapped, and
+        # truncating those under them kills them with SIGBUS. So nothing is
+        # rewritten in place: the paragraphs (and full vectors) went to a
+        # new versioned store directory, the index replaces the old file and
+        # the manifest naming the new store is swapped in last.
+        previous = self._read_manifest(file_path)
+        store = self._store_name(file_path, version)
+        manifest = {
+            "model_name": self.model_name,
+            "index_spec": self.index_spec,
+            "search_params": self.search_params,
+            "store": store,
+            "version": version,
+            "compression": self.compression,
+            "rerank_factor": self.rerank_factor,
+        }
+        if self.compression:
+            manifest["vectors"] = os.path.join(store, "vectors.f32")
+        faiss.write_index(self.index, file_path + ".tmp")
+        os.replace(file_path + ".tmp", file_path)
+        with open(file_path + "_manifest.json.tmp", "w") as f:
+            json.dump(manifest, f)
+        os.replace(file_path + "_manifest.json.tmp", file_path + "_manifest.json")
+        # Keep the previous store for processes that just read its manifest.
+        self._remove_stale_stores(
+            file_path, {store, previous.get("store"), previous.get("vectors")}
+        )
+        return manifest
+
+    @staticmethod
+    def _read_manifest(file_path):
+        manifest_path = file_path + "_manifest.json"
+        if not os.path.exists(manifest_path):
+            return {}
+        with open(manifest_path, "r") as f:
+            return json.load(f)
+
+    @staticmethod
+    def _remove_stale_stores(file_path, keep):
+        directory = os.path.dirname(file_path) or "."
+        name = os.path.basename(file_path)
+        for entry in os.listdir(directory):
+            stale = entry.startswith(name + "_store") or entry == name + "_vectors.f32"
+            if not stale or entry in keep:
+                continue
+            path = os.path.join(directory, entry)
+            if os.path.isdir(path):
+                shutil.rmtree(path, ignore_errors=True)
+            else:
+                os.remove(path)
+
+    def load_index(self, file_path, mmap=True):
+        """Load an index saved by ``save_index``.
+
+        With ``mmap`` the paragraph store is memory-mapped, and so is the
+        FAISS index for IVF types, or for every type with FAISS versions that
+        have ``IO_FLAG_MMAP_IFC``. Processes loading the same index then share
+        the page cache and loading only reads the 8-byte id map of flat and
+        HNSW indexes. Older FAISS versions read those indexes into memory.
+        """
+        with metrics.stage("load_index"):
+            self._load_index(file_path, mmap)
+
+    def _load_index(self, file_path, mmap):
+        self._check_not_streaming()
+        manifest = self._read_manifest(file_path)
+        if manifest:
+            if manifest["model_name"] != self.model_name:
+                log.warning(
+                    f"{file_path} was built with {manifest['model_name']}, "
+                    f"not {self.model_name}"
+                )
+        self.index_spec = manifest.get("index_spec", "Flat")
+        self.search_params = manifest.get("search_params", {})
+        self.compression = manifest.get("compression")
+        if self.rerank_factor is None:
+            self.rerank_factor = manifest.get("rerank_factor")
+        self._vector_chunks = []
+        self._pending = []
+        self.index = self._read_faiss_index(file_path, mmap and "store" in manifest)
+        set_search_params(self.index, self.search_params)
+        self._invalidate()
+
+        if "store" in manifest:
+            self._open_store(os.path.dirname(file_path), manifest)
+            return
+
+        # Indexes saved before the paragraph store keep texts in JSON.
+        self._read_only = False
         data_file_path = file_path + "_paragraphs.json"
         if os.path.exists(data_file_path):
             with open(data_file_path, "r") as f:
                 self.data = json.load(f)
         else:
             print(f"No data file found at {data_file_path}. Cannot query by text.")
+        self.ids = None
+        self.files = [None] * len(self.data or [])
+        self.headers = [None] * len(self.files)
+
+    def _open_store(self, directory, manifest):
+        store = ParagraphStore(os.path.join(directory, manifest["store"]))
+        self.data = store.texts
+        self.ids = store.ids
+        self.files = store.files
+        self.headers = store.headers
+        self._invalidate()
+        self._lookup = store.sorted_ids, store.positions
+        self._read_only = True
+        self._vector_chunks = []
+        if "vectors" in manifest and len(store):
+            self._vector_chunks = [
+                np.memmap(
+                    os.path.join(directory, manifest["vectors"]),
+                    dtype=np.float32,
+                    mode="r",
+                    shape=(len(store), self.index.d),
+                )
+            ]
+
+    def _read_faiss_index(self, file_path, mmap):
+        self._index_path = None
+        if mmap:
+            # IO_FLAG_MMAP only maps the inverted lists of IVF indexes and
+            # silently reads every other type into memory.
+            can_map = hasattr(faiss, "IO_FLAG_MMAP_IFC")
+            flag = faiss.IO_FLAG_MMAP_IFC if can_map else faiss.IO_FLAG_MMAP
+            try:
+                index = faiss.read_index(file_path, flag | faiss.IO_FLAG_READ_ONLY)
+            except RuntimeError as e:
+                log.debug(f"Cannot memory-map {file_path}, reading it: {e}")
+            else:
+                if can_map or self.index_spec.startswith("IVF"):
+                    # Mapped indexes are read again before changing them.
+                    self._index_path = file_path
+                else:
+                    log.debug(f"FAISS read {self.index_spec} index into memory")
+                return index
+        return faiss.read_index(file_path)
+
+    def memory_usage(self):
+        """Estimate the bytes this indexer keeps in process memory.
+
+        Memory-mapped parts, i.e. the paragraph store, the full vectors and
+        the FAISS codes of an index loaded with ``mmap``, are not counted:
+        their pages live in the shared page cache and can be dropped by the
+        OS. Paragraphs held as Python lists, e.g. after loading a legacy JSON
+        sidecar, are counted object by object.
+        """
+        size = 0
+        if self.index is not None:
+            mapped = self._index_path is not None
+            size += index_memory_usage(self.index, mapped)
+        arrays = [vectors for vectors, _ in self._pending]
+        arrays += [ids for _, ids in self._pending]
+        arrays += self._vector_chunks
+        if self._lookup is not None:
+            arrays += list(self._lookup)
+        size += sum(a.nbytes for a in arrays if not isinstance(a, np.memmap))
+        if self._known is not None:
+            size += self._known.nbytes
+        if not self._read_only:
+            columns = [self.data or [], self.files, self.headers]
+            if self.ids is not None:
+                columns.append(self.ids)
+            size += sum(_list_bytes(column) for column in columns)
+        return size
 
     def search(self, search_text, top_k=2):
-        search_vector = self.generate_encodings([search_text])
-        faiss.normalize_L2(search_vector)
-        k = self.index.ntotal if top_k is None else top_k
-        distances, indices = self.index.search(search_vector, k)
-        # Ensure indices are within bounds
-        assert all(
-            0 <= i < len(self.data) for i in indices[0]
-        ), f"Invalid indices: {indices}"
-        # Return the text corresponding to the indices
-        return [self.data[i] for i in indices[0]]
+        results = self.search_batch([search_text], top_k)[0]
+        return [result["text"] for result in results]
+
+    def search_batch(self, queries, top_k=2):
+        """Search many queries with one encoder pass and one FAISS call.
+
+        Returns one list per query of ``{"id", "text", "file", "header",
+        "score"}`` results, best first, where ``score`` is the cosine
+        similarity.
+        """
+        if not queries:
+            return []
+        vectors = np.ascontiguousarray(
+            self.generate_encodings(list(queries)), dtype=np.float32
+        )
+        faiss.normalize_L2(vectors)
+        return self.search_vectors(vectors, top_k)
+
+    def search_vectors(self, vectors, top_k=2):
+        """Search L2-normalized query vectors, see ``search_batch``."""
+        self._check_not_streaming()
+        self._build_pending()
+        # Never ask FAISS for more results than there are vectors.
+        k = self.index.ntotal if top_k is None else min(top_k, self.index.ntotal)
+        if k <= 0:
+            return [[] for _ in vectors]
+        factor = self.rerank_factor
+        if factor is None:
+            factor = DEFAULT_RERANK_FACTOR
+        rerank = bool(self.compression and factor)
+        candidates = k
+        if rerank:
+            candidates = max(k, min(k * factor, self.index.ntotal))
+        metrics.observe("search_batch_size", len(vectors), SIZE_BUCKETS)
+        with metrics.stage("index_search"):
+            distances, labels = self.index.search(vectors, candidates)
+        positions = self._label_positions(labels)
+        if rerank:
+            with metrics.stage("rerank"):
+                distances, labels, positions = self._rerank(
+                    vectors, labels, positions, k
+                )
+        # Vectors are unit length, so squared L2 distance is 2 - 2 * cosine.
+        scores = 1.0 - distances / 2.0
+        results = []
+        for row_positions, row_labels, row_scores in zip(positions, labels, scores):
+            valid = row_positions >= 0
+            results.append(
+                [
+                    {
+                        "id": int(label),
+                        "text": self.data[position],
+                        "file": self.files[position],
+                        "header": self.headers[position],
+                        "score": float(score),
+                    }
+                    for position, label, score in zip(
+                        row_positions[valid].tolist(),
+                        row_labels[valid].tolist(),
+                        row_scores[valid].tolist(),
+                    )
+                ]
+            )
+        return results
+
+    def _rerank(self, queries, labels, positions, k, block_size=256):
+        # Re-score candidates with exact distances to the full-precision
+        # vectors, a block of queries at a time to bound the gathered rows.
+        full = self._full_vectors()
+        k = min(k, labels.shape[1])
+        distances = np.empty((len(queries), k), dtype=np.float32)
+        top_labels = np.empty((len(queries), k), dtype=np.int64)
+        top_positions = np.empty((len(queries), k), dtype=np.int64)
+        for start in range(0, len(queries), block_size):
+            rows = slice(start, start + block_size)
+            valid = positions[rows] >= 0
+            candidates = full[np.where(valid, positions[rows], 0)]
+            exact = ((candidates - queries[rows, None, :]) ** 2).sum(axis=2)
+            exact[~valid] = np.inf
+            order = np.argsort(exact, axis=1, kind="stable")[:, :k]
+            distances[rows] = np.take_along_axis(exact, order, axis=1)
+            top_labels[rows] = np.take_along_axis(labels[rows], order, axis=1)
+            top_positions[rows] = np.take_along_axis(positions[rows], order, axis=1)
+        top_positions[np.isinf(distances)] = -1
+        return distances, top_labels, top_positions
+
+    def _label_positions(self, labels):
+        # Map FAISS labels to positions in self.data; padding (-1) and
+        # unknown labels map to -1.
+        if self.ids is None:
+            positions = labels.copy()
+        elif len(self.ids) == 0:
+            return np.full(labels.shape, -1, dtype=np.int64)
+        else:
+            sorted_ids, order = self._id_lookup()
+            slots = np.minimum(np.searchsorted(sorted_ids, labels), len(order) - 1)
+            positions = np.where(sorted_ids[slots] == labels, order[slots], -1)
+        positions[(positions < 0) | (positions >= len(self.data))] = -1
+        return positions
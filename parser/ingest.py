@@ -0,0 +1,195 @@
+"""
+Bulk PDF ingestion: parses pages across a process pool and streams the
+paragraphs in fixed-size batches into a TextIndexer. Parsing only holds a few
+page ranges at a time and the CLI writes each batch straight to the index's
+store (``TextIndexer.stream_to``), so only the FAISS index and 8 bytes per
+paragraph id grow with the corpus. PDFs that fail to parse are logged and
+skipped.
+
+    python -m parser.ingest --index tmp.index.faiss data/
+"""
+
+import argparse
+import os
+import sys
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from itertools import islice
+from parser.document_parser import split_page
+from parser.indexer import TextIndexer
+from parser.utils import configure_logger, metrics
+
+import fitz
+from dotenv import load_dotenv
+
+load_dotenv()
+
+log = configure_logger(__name__)
+
+
+def find_pdfs(paths):
+    for path in paths:
+        if os.path.isdir(path):
+            for root, _, files in os.walk(path):
+                for name in sorted(files):
+                    if name.lower().endswith(".pdf"):
+                        yield os.path.join(root, name)
+        else:
+            yield path
+
+
+def page_ranges(pdf_paths, pages_per_task):
+    for path in pdf_paths:
+        try:
+            pdf_document = fitz.open(path)
+            page_count = pdf_document.page_count
+            pdf_document.close()
+        except (RuntimeError, ValueError) as e:
+            log.error(f"Skipping {path}, failed to open it: {e}")
+            metrics.inc("parse_errors")
+            continue
+        for start in range(0, page_count, pages_per_task):
+            yield path, start, min(start + pages_per_task, page_count)
+
+
+def parse_pages(path, start, stop):
+    filename = os.path.basename(path)
+    try:
+        pdf_document = fitz.open(path)
+        items = []
+        for page_num in range(start, stop):
+            items.extend(split_page(pdf_document[page_num].get_text(), filename))
+        pdf_document.close()
+    except (RuntimeError, ValueError) as e:
+        raise ValueError(f"Failed to open or parse {filename}: {e}")
+    return items
+
+
+def _parsed_ranges(pdf_paths, workers, pages_per_task, max_pending):
+    # Parse page ranges in a process pool, yielding their items in order
+    # with at most ``max_pending`` ranges in flight.
+    workers = workers or os.cpu_count()
+    max_pending = max_pending or 2 * workers
+    with ProcessPoolExecutor(workers) as executor:
+        pending = deque()
+        for task in page_ranges(pdf_paths, pages_per_task):
+            pending.append((task, executor.submit(parse_pages, *task)))
+            if len(pending) >= max_pending:
+                yield _result(*pending.popleft())
+        while pending:
+            yield _result(*pending.popleft())
+
+
+def _result(task, future):
+    path, start, stop = task
+    try:
+        with metrics.stage("parse_wait"):
+            items = future.result()
+    except ValueError as e:
+        # One corrupt PDF must not abort a bulk run.
+        log.error(f"Skipping pages {start + 1}-{stop} of {path}: {e}")
+        metrics.inc("parse_errors")
+        return []
+    metrics.inc("pages_parsed", stop - start)
+    return items
+
+
+def iter_paragraphs(pdf_paths, workers=None, pages_per_task=8, max_pending=None):
+    """Yield ``{"text", "file", "header"}`` paragraphs of ``pdf_paths`` in order.
+
+    Only ``max_pending`` page ranges are held at a time. Each paragraph
+    carries the last section header seen before it in its file.
+    """
+    filename = header = None
+    for items in _parsed_ranges(pdf_paths, workers, pages_per_task, max_pending):
+        for item in items:
+            if item["file"] != filename:
+                filename, header = item["file"], None
+            if "header" in item:
+                header = item["header"]
+            else:
+                item["header"] = header
+                metrics.inc("paragraphs_parsed")
+                yield item
+
+
+def batched(iterable, size):
+    iterator = iter(iterable)
+    while True:
+        batch = list(islice(iterator, size))
+        if not batch:
+            return
+        yield batch
+
+
+def ingest(pdf_paths, indexer, batch_size=256, workers=None, pages_per_task=8):
+    """Parse ``pdf_paths`` and add their paragraphs to ``indexer`` batch by batch.
+
+    Returns the number of paragraphs added.
+    """
+    added = 0
+    paragraphs = iter_paragraphs(pdf_paths, workers, pages_per_task)
+    for batch in batched(paragraphs, batch_size):
+        added += indexer.add_documents(batch)
+        log.info(f"Indexed {added} paragraphs")
+    return added
+
+
+def main(argv=None):
+    arg_parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    arg_parser.add_argument("paths", nargs="+", help="PDF files or directories")
+    arg_parser.add_argument("--index", default=os.getenv("INDEX_NAME"))
+    arg_parser.add_argument("--model", default="paraphrase-mpnet-base-v2")
+    arg_parser.add_argument("--index-spec", default=os.getenv("INDEX_SPEC", "Flat"))
+    arg_parser.add_argument("--cache-dir", default=os.getenv("EMBEDDING_CACHE"))
+    arg_parser.add_argument(
+        "--compression",
+        default=os.getenv("COMPRESSION"),
+        help="Store fp16, int8 or pq<m> vectors and re-rank exactly",
+    )
+    arg_parser.add_argument(
+        "--rerank-factor",
+        type=int,
+        default=None,
+        help="Candidates re-ranked per result, defaults to the saved index's",
+    )
+    arg_parser.add_argument("--batch-size", type=int, default=256)
+    arg_parser.add_argument("--pages-per-task", type=int, default=8)
+    arg_parser.add_argument("--workers", type=int, default=None)
+    arg_parser.add_argument(
+        "--profile-stages",
+        default=None,
+        help="Comma-separated stages to profile, or all; overrides PROFILE_STAGES",
+    )
+    args = arg_parser.parse_args(argv)
+    if args.profile_stages is not None:
+        stages = args.profile_stages.split(",")
+        metrics.set_profiling([s.strip() for s in stages if s.strip()])
+
+    indexer = TextIndexer(
+        model_name=args.model,
+        cache_dir=args.cache_dir,
+        index_spec=args.index_spec,
+        compression=args.compression,
+        rerank_factor=args.rerank_factor,
+    )
+    if os.path.exists(args.index):
+        indexer.load_index(args.index)
+    indexer.stream_to(args.index)
+
+    added = ingest(
+        find_pdfs(args.paths),
+        indexer,
+        batch_size=args.batch_size,
+        workers=args.workers,
+        pages_per_task=args.pages_per_task,
+    )
+    indexer.save_index(args.index)
+    log.info(f"Added {added} paragraphs to {args.index}")
+    if metrics.profiled_stages:
+        # Stages run by the parser processes are not seen here.
+        sys.stderr.write(metrics.profile_report())
+
+
+if __name__ == "__main__":
+    main()
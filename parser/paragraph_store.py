@@ -0,0 +1,255 @@
+import os
+import shutil
+
+import numpy as np
+
+
+class StringColumn:
+    """Read-only strings stored as a UTF-8 blob plus an offsets array.
+
+    Both files are memory-mapped, so only the strings that are indexed are
+    read from disk.
+    """
+
+    def __init__(self, path):
+        self._offsets = np.load(path + ".offsets.npy", mmap_mode="r")
+        if self._offsets[-1] > 0:
+            self._blob = np.memmap(path + ".bin", dtype=np.uint8, mode="r")
+        else:
+            self._blob = np.empty(0, dtype=np.uint8)
+
+    def __len__(self):
+        return len(self._offsets) - 1
+
+    def __getitem__(self, i):
+        if i < 0:
+            i += len(self)
+        if not 0 <= i < len(self):
+            raise IndexError(i)
+        start, stop = self._offsets[i], self._offsets[i + 1]
+        return self._blob[start:stop].tobytes().decode("utf-8")
+
+    def __iter__(self):
+        return (self[i] for i in range(len(self)))
+
+
+class IdSet:
+    """Set of int64 ids held as a few sorted arrays, 8 bytes per id.
+
+    Added batches become sorted runs and runs of similar size are merged,
+    so there are O(log n) of them to search.
+    """
+
+    def __init__(self, ids=()):
+        self._runs = []
+        self.add(ids)
+
+    def add(self, ids):
+        run = np.unique(np.asarray(ids, dtype=np.int64))
+        if len(run):
+            self._runs.append(run)
+        while len(self._runs) > 1 and len(self._runs[-2]) <= 2 * len(self._runs[-1]):
+            run = self._runs.pop()
+            self._runs[-1] = np.union1d(self._runs[-1], run)
+
+    @property
+    def nbytes(self):
+        return sum(run.nbytes for run in self._runs)
+
+    def contains(self, ids):
+        """Boolean array telling which of ``ids`` are in the set."""
+        ids = np.asarray(ids, dtype=np.int64)
+        found = np.zeros(len(ids), dtype=bool)
+        for run in self._runs:
+            slots = np.minimum(np.searchsorted(run, ids), len(run) - 1)
+            found |= run[slots] == ids
+        return found
+
+
+class ArrayWriter:
+    """Append-only 1-d array, written as a ``.npy`` file on ``close``.
+
+    Values go to a raw ``.tmp`` file as they arrive and are copied behind a
+    ``.npy`` header once the final length is known.
+    """
+
+    def __init__(self, path, dtype):
+        self.path = path
+        self.dtype = np.dtype(dtype)
+        self.count = 0
+        self._file = open(path + ".tmp", "wb")
+
+    def append(self, values):
+        values = np.asarray(values, dtype=self.dtype)
+        values.tofile(self._file)
+        self.count += len(values)
+
+    def close(self):
+        self._file.close()
+        header = {
+            "descr": np.lib.format.dtype_to_descr(self.dtype),
+            "fortran_order": False,
+            "shape": (self.count,),
+        }
+        with open(self.path, "wb") as out, open(self.path + ".tmp", "rb") as f:
+            np.lib.format.write_array_header_1_0(out, header)
+            shutil.copyfileobj(f, out, 1 << 20)
+        os.remove(self.path + ".tmp")
+
+
+class StringColumnWriter:
+    """Append strings to a ``StringColumn`` at ``path``."""
+
+    def __init__(self, path):
+        self.count = 0
+        self._blob = open(path + ".bin", "wb")
+        self._offsets = ArrayWriter(path + ".offsets.npy", np.int64)
+        self._offsets.append([0])
+        self._end = 0
+
+    def append(self, strings):
+        ends = []
+        for string in strings:
+            encoded = string.encode("utf-8")
+            self._blob.write(encoded)
+            self._end += len(encoded)
+            ends.append(self._end)
+        self._offsets.append(ends)
+        self.count += len(ends)
+
+    def close(self):
+        self._blob.close()
+        self._offsets.close()
+
+
+class CodedColumn:
+    """Column of optional strings stored as int32 codes into a string table."""
+
+    def __init__(self, codes, table):
+        self._codes = codes
+        self._table = table
+
+    def __len__(self):
+        return len(self._codes)
+
+    def __getitem__(self, i):
+        code = self._codes[i]
+        return None if code < 0 else self._table[code]
+
+    def __iter__(self):
+        return (self[i] for i in range(len(self)))
+
+
+class CodedColumnWriter:
+    """Append optional strings to a ``CodedColumn``.
+
+    A table entry is added whenever the value changes, so a run of
+    paragraphs from one file or section stores its name once without
+    keeping every distinct value in memory.
+    """
+
+    def __init__(self, codes_path, table_path):
+        self._codes = ArrayWriter(codes_path, np.int32)
+        self._table = StringColumnWriter(table_path)
+        self._last = None
+
+    def append(self, values):
+        codes, new = [], []
+        for value in values:
+            if value is None:
+                codes.append(-1)
+                continue
+            if value != self._last:
+                new.append(value)
+                self._last = value
+            codes.append(self._table.count + len(new) - 1)
+        self._table.append(new)
+        self._codes.append(codes)
+
+    def close(self):
+        self._codes.close()
+        self._table.close()
+
+
+class ParagraphStore:
+    """Memory-mapped paragraph texts with their id, file and header columns.
+
+    The store is a directory holding the texts as a ``StringColumn``, one
+    ``.npy`` file per column and the ids sorted for label lookups. Opening it
+    costs the same regardless of how many paragraphs it holds.
+    """
+
+    def __init__(self, directory):
+        def path(name):
+            return os.path.join(directory, name)
+
+        self.texts = StringColumn(path("texts"))
+        self.ids = np.load(path("ids.npy"), mmap_mode="r")
+        self.files = CodedColumn(
+            np.load(path("file_codes.npy"), mmap_mode="r"), StringColumn(path("files"))
+        )
+        self.headers = CodedColumn(
+            np.load(path("header_codes.npy"), mmap_mode="r"),
+            StringColumn(path("headers")),
+        )
+        self.sorted_ids = np.load(path("sorted_ids.npy"), mmap_mode="r")
+        self.positions = np.load(path("positions.npy"), mmap_mode="r")
+
+    def __len__(self):
+        return len(self.texts)
+
+    @staticmethod
+    def write(directory, texts, ids, files, headers):
+        writer = ParagraphStoreWriter(directory)
+        writer.append(texts, ids, files, headers)
+        writer.close()
+
+
+class ParagraphStoreWriter:
+    """Write a ``ParagraphStore`` directory batch by batch.
+
+    Only the current batch is held in memory. ``append_vectors`` adds rows
+    to an optional float32 ``vectors.f32`` file aligned with the paragraphs.
+    ``close`` sorts the ids for label lookups, reading back 8 bytes per
+    paragraph.
+    """
+
+    def __init__(self, directory):
+        os.makedirs(directory, exist_ok=True)
+        self.directory = directory
+        self._texts = StringColumnWriter(self._path("texts"))
+        self._ids = ArrayWriter(self._path("ids.npy"), np.int64)
+        self._files = CodedColumnWriter(
+            self._path("file_codes.npy"), self._path("files")
+        )
+        self._headers = CodedColumnWriter(
+            self._path("header_codes.npy"), self._path("headers")
+        )
+        self._vectors = None
+
+    def _path(self, name):
+        return os.path.join(self.directory, name)
+
+    def __len__(self):
+        return self._ids.count
+
+    def append(self, texts, ids, files, headers):
+        self._texts.append(texts)
+        self._ids.append(ids)
+        self._files.append(files)
+        self._headers.append(headers)
+
+    def append_vectors(self, vectors):
+        if self._vectors is None:
+            self._vectors = open(self._path("vectors.f32"), "wb")
+        np.ascontiguousarray(vectors, dtype=np.float32).tofile(self._vectors)
+
+    def close(self):
+        for column in (self._texts, self._ids, self._files, self._headers):
+            column.close()
+        if self._vectors is not None:
+            self._vectors.close()
+        ids = np.load(self._path("ids.npy"))
+        positions = np.argsort(ids, kind="stable")
+        np.save(self._path("sorted_ids.npy"), ids[positions])
+        np.save(self._path("positions.npy"), positions.astype(np.int64))
@@ -0,0 +1,345 @@
+"""
+Resident search service: loads the encoder and index once and answers
+queries over local HTTP, coalescing concurrent queries into micro-batches.
+
+    python -m parser.server --index tmp.index.faiss --port 8600
+"""
+
+import argparse
+import json
+import os
+import queue
+import threading
+import time
+import urllib.error
+import urllib.request
+from concurrent import futures
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from parser.indexer import TextIndexer
+from parser.stub_encoder import HashingEncoder
+from parser.utils import SIZE_BUCKETS, configure_logger, metrics
+
+from dotenv import load_dotenv
+
+load_dotenv()
+
+log = configure_logger(__name__)
+
+
+class Overloaded(RuntimeError):
+    pass
+
+
+class MicroBatcher:
+    """Coalesce concurrent queries into ``TextIndexer.search_batch`` calls.
+
+    A dispatcher thread collects queued queries until ``max_batch_size`` is
+    reached or the oldest has waited ``max_wait_ms``, then hands the batch
+    to a pool of ``workers`` threads. At most ``workers`` batches run at a
+    time; once ``max_queue`` queries are waiting, ``submit`` raises
+    ``Overloaded`` instead of queueing more.
+    """
+
+    def __init__(
+        self, indexer, max_batch_size=64, max_wait_ms=5, max_queue=1024, workers=2
+    ):
+        self.indexer = indexer
+        self.max_batch_size = max_batch_size
+        self.max_wait = max_wait_ms / 1000
+        self.max_queue = max_queue
+        self._queue = queue.Queue(max_queue)
+        self._slots = threading.Semaphore(workers)
+        self._executor = futures.ThreadPoolExecutor(workers)
+        self._thread = threading.Thread(target=self._dispatch, daemon=True)
+        self._thread.start()
+
+    def submit(self, query, top_k=2):
+        future = futures.Future()
+        try:
+            self._queue.put_nowait((query, top_k, future))
+        except queue.Full:
+            metrics.inc("server_rejected")
+            raise Overloaded(f"{self._queue.maxsize} queries already waiting")
+        return future
+
+    def search(self, query, top_k=2, timeout=None):
+        return self.submit(query, top_k).result(timeout)
+
+    def close(self):
+        self._queue.put(None)
+        self._thread.join()
+        self._executor.shutdown()
+
+    def _dispatch(self):
+        while True:
+            first = self._queue.get()
+            if first is None:
+                return
+            batch = [first]
+            deadline = time.monotonic() + self.max_wait
+            while len(batch) < self.max_batch_size:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                try:
+                    item = self._queue.get(timeout=remaining)
+                except queue.Empty:
+                    break
+                if item is None:
+                    self._queue.put(None)
+                    break
+                batch.append(item)
+            metrics.observe("server_batch_size", len(batch), SIZE_BUCKETS)
+            # Wait for a free worker so queries pile up in the bounded queue.
+            self._slots.acquire()
+            self._executor.submit(self._run, batch)
+
+    def _run(self, batch):
+        try:
+            # Drop queries whose request already failed or timed out.
+            batch = [item for item in batch if item[2].set_running_or_notify_cancel()]
+            if not batch:
+                return
+            top_k = max(k for _, k, _ in batch)
+            results = self.indexer.search_batch([q for q, _, _ in batch], top_k)
+            for (_, k, future), result in zip(batch, results):
+                future.set_result(result[:k])
+        except Exception as e:
+            log.exception("Search batch failed")
+            for _, _, future in batch:
+                if not future.done():
+                    future.set_exception(e)
+        finally:
+            self._slots.release()
+
+
+class SearchHandler(BaseHTTPRequestHandler):
+    """Routes of the search service.
+
+    ``GET /health``, ``POST /search`` with ``{"query" | "queries", "top_k"}``
+    where ``top_k`` is at most the server's ``max_top_k`` and ``queries``
+    holds at most ``max_queries`` strings,
+    ``GET /metrics`` (Prometheus text, ``?format=json`` for a snapshot),
+    ``GET /profile`` for the collected profiles and ``POST /profile`` with
+    ``{"stages": [...]}`` to choose the profiled stages.
+    """
+
+    timeout_s = 30
+
+    def do_GET(self):
+        if self.path == "/health":
+            indexer = self.server.batcher.indexer
+            self._reply(
+                200,
+                {
+                    "status": "ok",
+                    "paragraphs": len(indexer.data),
+                    "max_queries": self.server.max_queries,
+                    "max_top_k": self.server.max_top_k,
+                },
+            )
+        elif self.path == "/metrics":
+            self._reply_text(200, metrics.prometheus_text())
+        elif self.path == "/metrics?format=json":
+            self._reply(200, metrics.snapshot())
+        elif self.path == "/profile":
+            self._reply_text(200, metrics.profile_report())
+        else:
+            self._reply(404, {"error": f"Unknown path {self.path}"})
+
+    def do_POST(self):
+        if self.path == "/profile":
+            try:
+                stages = list(self._read_json()["stages"])
+            except (ValueError, KeyError, TypeError) as e:
+                self._reply(400, {"error": f"Invalid request: {e}"})
+                return
+            metrics.set_profiling(stages)
+            self._reply(200, {"profiling": sorted(metrics.profiled_stages)})
+            return
+        if self.path != "/search":
+            self._reply(404, {"error": f"Unknown path {self.path}"})
+            return
+        try:
+            request = self._read_json()
+            if not isinstance(request, dict):
+                raise TypeError("the body must be a JSON object")
+            top_k = int(request.get("top_k", 2))
+            single = "query" in request
+            queries = [request["query"]] if single else request["queries"]
+            if not isinstance(queries, list) or not all(
+                isinstance(query, str) for query in queries
+            ):
+                raise TypeError('"query" must be a string, "queries" a list of them')
+        except (ValueError, KeyError, TypeError) as e:
+            self._reply(400, {"error": f"Invalid request: {e}"})
+            return
+        # Checked before queueing anything: a request larger than the queue
+        # could never be answered and would only crowd out other clients.
+        if len(queries) > self.server.max_queries:
+            self._reply(
+                413, {"error": f"At most {self.server.max_queries} queries per request"}
+            )
+            return
+        # A batch runs with its largest top_k, so one huge value would make
+        # every query batched with it fail.
+        if not 1 <= top_k <= self.server.max_top_k:
+            self._reply(
+                400, {"error": f"top_k must be between 1 and {self.server.max_top_k}"}
+            )
+            return
+
+        pending = []
+        try:
+            for query in queries:
+                pending.append(self.server.batcher.submit(query, top_k))
+            results = [f.result(self.timeout_s) for f in pending]
+        except Overloaded as e:
+            self._reply(503, {"error": str(e)})
+            return
+        except futures.TimeoutError:
+            self._reply(504, {"error": "Search timed out"})
+            return
+        except Exception as e:
+            self._reply(500, {"error": str(e)})
+            return
+        finally:
+            # Queries of a failed request that have not started are skipped.
+            for future in pending:
+                future.cancel()
+        self._reply(200, {"results": results[0] if single else results})
+
+    def _read_json(self):
+        length = int(self.headers.get("Content-Length", 0))
+        return json.loads(self.rfile.read(length))
+
+    def _reply(self, status, payload):
+        self._send(status, json.dumps(payload), "application/json")
+
+    def _reply_text(self, status, text):
+        self._send(status, text, "text/plain; version=0.0.4")
+
+    def _send(self, status, text, content_type):
+        body = text.encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        log.debug(format % args)
+
+
+class SearchServer(ThreadingHTTPServer):
+    daemon_threads = True
+    request_queue_size = 1024
+
+    def __init__(self, address, batcher, max_top_k=1000, max_queries=256):
+        super().__init__(address, SearchHandler)
+        self.batcher = batcher
+        self.max_top_k = max_top_k
+        self.max_queries = min(max_queries, batcher.max_queue)
+
+
+class SearchClient:
+    """Client for a running ``SearchServer``."""
+
+    def __init__(self, url, timeout=30):
+        self.url = url.rstrip("/")
+        self.timeout = timeout
+        self._max_queries = None
+
+    def health(self):
+        with urllib.request.urlopen(self.url + "/health", timeout=self.timeout) as f:
+            return json.load(f)
+
+    def search(self, query, top_k=2):
+        return self._post({"query": query, "top_k": top_k})
+
+    def search_batch(self, queries, top_k=2):
+        """Search ``queries`` in requests of at most the server's ``max_queries``."""
+        if self._max_queries is None:
+            self._max_queries = self.health()["max_queries"]
+        queries = list(queries)
+        results = []
+        for start in range(0, len(queries), self._max_queries):
+            chunk = queries[start : start + self._max_queries]
+            results.extend(self._post({"queries": chunk, "top_k": top_k}))
+        return results
+
+    def _post(self, payload):
+        request = urllib.request.Request(
+            self.url + "/search",
+            data=json.dumps(payload).encode("utf-8"),
+            headers={"Content-Type": "application/json"},
+        )
+        try:
+            with urllib.request.urlopen(request, timeout=self.timeout) as response:
+                return json.load(response)["results"]
+        except urllib.error.HTTPError as e:
+            raise RuntimeError(f"Search failed ({e.code}): {e.read().decode()}")
+
+
+def main(argv=None):
+    arg_parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    arg_parser.add_argument("--index", default=os.getenv("INDEX_NAME"))
+    arg_parser.add_argument("--model", default="paraphrase-mpnet-base-v2")
+    arg_parser.add_argument("--cache-dir", default=None)
+    arg_parser.add_argument(
+        "--stub-encoder",
+        type=int,
+        metavar="DIM",
+        default=None,
+        help="Use the offline HashingEncoder with DIM dimensions",
+    )
+    arg_parser.add_argument("--host", default="127.0.0.1")
+    arg_parser.add_argument("--port", type=int, default=8600)
+    arg_parser.add_argument("--max-batch-size", type=int, default=64)
+    arg_parser.add_argument("--max-wait-ms", type=float, default=5)
+    arg_parser.add_argument("--max-queue", type=int, default=1024)
+    arg_parser.add_argument("--workers", type=int, default=2)
+    arg_parser.add_argument("--max-top-k", type=int, default=1000)
+    arg_parser.add_argument("--max-queries", type=int, default=256)
+    arg_parser.add_argument(
+        "--rerank-factor",
+        type=int,
+        default=None,
+        help="Candidates re-ranked per result, defaults to the saved index's",
+    )
+    args = arg_parser.parse_args(argv)
+
+    if args.stub_encoder:
+        # Its own model name keeps stub vectors out of the model's cache.
+        encoder, model_name = HashingEncoder(args.stub_encoder), "hashing-stub"
+    else:
+        encoder, model_name = None, args.model
+    indexer = TextIndexer(
+        model_name=model_name,
+        cache_dir=args.cache_dir,
+        encoder=encoder,
+        rerank_factor=args.rerank_factor,
+    )
+    indexer.load_index(args.index)
+    batcher = MicroBatcher(
+        indexer,
+        max_batch_size=args.max_batch_size,
+        max_wait_ms=args.max_wait_ms,
+        max_queue=args.max_queue,
+        workers=args.workers,
+    )
+    server = SearchServer(
+        (args.host, args.port), batcher, args.max_top_k, args.max_queries
+    )
+    log.info(f"Serving {args.index} on http://{args.host}:{args.port}")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+        batcher.close()
+
+
+if __name__ == "__main__":
+    main()
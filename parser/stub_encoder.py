@@ -0,0 +1,28 @@
+import hashlib
+import re
+
+import numpy as np
+
+
+class HashingEncoder:
+    """Deterministic offline stand-in for a SentenceTransformer.
+
+    Each lower-cased word is hashed to a signed bucket of a
+    ``dimension``-wide vector, so texts sharing words get similar vectors.
+    Used for load tests and benchmarks that must not download a model.
+    """
+
+    def __init__(self, dimension=768):
+        self.dimension = dimension
+
+    def encode(self, texts, **kwargs):
+        vectors = np.zeros((len(texts), self.dimension), dtype=np.float32)
+        for row, text in enumerate(texts):
+            for word in re.findall(r"\w+", text.lower()):
+                digest = hashlib.blake2b(word.encode("utf-8"), digest_size=8).digest()
+                bucket = int.from_bytes(digest[:4], "little") % self.dimension
+                sign = 1.0 if digest[4] & 1 else -1.0
+                vectors[row, bucket] += sign
+            # Keep empty texts off the origin so they can be normalized.
+            vectors[row, 0] += 1e-3
+        return vectors
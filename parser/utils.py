@@ -1,20 +1,194 @@
+import cProfile
+import io
 import logging
 import os
+import pstats
+import re
+import threading
+import time
+from contextlib import contextmanager
 
 
 def configure_logger(name):
+    level = os.getenv("LOG_LEVEL", "INFO").upper()
     logger = logging.getLogger(name)
-    logger.setLevel(logging.INFO)
-    ch = logging.StreamHandler()
-    ch.setLevel(logging.INFO)
-    formatter = logging.Formatter(
-        "%(asctime)s - %(name)s - %(levelname)s - %(message)s"
-    )
-    ch.setFormatter(formatter)
-    logger.addHandler(ch)
+    logger.setLevel(level)
+    # Modules configure their logger at import; only add the handler once.
+    if not logger.handlers:
+        ch = logging.StreamHandler()
+        ch.setLevel(level)
+        formatter = logging.Formatter(
+            "%(asctime)s - %(name)s - %(levelname)s - %(message)s"
+        )
+        ch.setFormatter(formatter)
+        logger.addHandler(ch)
 
     return logger
 
 
 def normalize_paths(path_list):
     return [os.path.normpath(p) for p in path_list]
+
+
+SECONDS_BUCKETS = (
+    0.0005,
+    0.001,
+    0.0025,
+    0.005,
+    0.01,
+    0.025,
+    0.05,
+    0.1,
+    0.25,
+    0.5,
+    1.0,
+    2.5,
+    5.0,
+    10.0,
+    30.0,
+)
+SIZE_BUCKETS = (1, 2, 4, 8, 16, 32, 64, 128, 256, 512, 1024, 4096)
+
+
+class Histogram:
+    def __init__(self, buckets):
+        self.buckets = tuple(buckets)
+        self.counts = [0] * (len(self.buckets) + 1)
+        self.count = 0
+        self.sum = 0.0
+
+    def observe(self, value):
+        for i, bound in enumerate(self.buckets):
+            if value <= bound:
+                break
+        else:
+            i = len(self.buckets)
+        self.counts[i] += 1
+        self.count += 1
+        self.sum += value
+
+    def snapshot(self):
+        cumulative, buckets = 0, {}
+        for bound, count in zip(self.buckets + ("+Inf",), self.counts):
+            cumulative += count
+            buckets[str(bound)] = cumulative
+        return {"count": self.count, "sum": self.sum, "buckets": buckets}
+
+
+class Metrics:
+    """Process-wide counters, histograms and optional per-stage profiling.
+
+    ``stage(name)`` times a block into the ``<name>_seconds`` histogram and,
+    when profiling is enabled for that stage, runs it under cProfile.
+    Profiling starts from the comma-separated ``PROFILE_STAGES`` variable
+    (``all`` for every stage) and can be changed at runtime with
+    ``set_profiling``.
+    """
+
+    prefix = "vector_search_"
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._local = threading.local()
+        self.counters = {}
+        self.histograms = {}
+        self.profiles = {}
+        stages = os.getenv("PROFILE_STAGES", "")
+        self.set_profiling([s.strip() for s in stages.split(",") if s.strip()])
+
+    def inc(self, name, value=1):
+        with self._lock:
+            self.counters[name] = self.counters.get(name, 0) + value
+
+    def observe(self, name, value, buckets=SECONDS_BUCKETS):
+        with self._lock:
+            histogram = self.histograms.get(name)
+            if histogram is None:
+                histogram = self.histograms[name] = Histogram(buckets)
+            histogram.observe(value)
+
+    @contextmanager
+    def stage(self, name):
+        profile = self._start_profile(name)
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(f"{name}_seconds", time.perf_counter() - start)
+            if profile is not None:
+                profile.disable()
+                self._local.profiling = False
+
+    def _start_profile(self, name):
+        if not self._profiles_stage(name) or getattr(self._local, "profiling", False):
+            return None
+        # One profile per stage and thread, a profile shared by threads
+        # running the same stage mixes up their call stacks.
+        key = (name, threading.get_ident())
+        with self._lock:
+            profile = self.profiles.setdefault(key, cProfile.Profile())
+        try:
+            profile.enable()
+        except ValueError:
+            # Another profiler is already running, e.g. in another thread.
+            return None
+        self._local.profiling = True
+        return profile
+
+    def _profiles_stage(self, name):
+        return "all" in self.profiled_stages or name in self.profiled_stages
+
+    def set_profiling(self, stages):
+        """Profile the named stages from now on; ``[]`` turns profiling off."""
+        self.profiled_stages = frozenset(stages)
+
+    def profile_report(self, limit=20):
+        profiles = {}
+        with self._lock:
+            for (name, _), profile in self.profiles.items():
+                profiles.setdefault(name, []).append(profile)
+        out = io.StringIO()
+        for name, stage_profiles in sorted(profiles.items()):
+            out.write(f"== {name} ==\n")
+            stats = pstats.Stats(*stage_profiles, stream=out)
+            stats.sort_stats("cumulative").print_stats(limit)
+        return out.getvalue()
+
+    def snapshot(self):
+        with self._lock:
+            return {
+                "counters": dict(self.counters),
+                "histograms": {
+                    name: histogram.snapshot()
+                    for name, histogram in self.histograms.items()
+                },
+                "profiling": sorted(self.profiled_stages),
+            }
+
+    def prometheus_text(self):
+        """Render the metrics in the Prometheus text exposition format."""
+        snapshot = self.snapshot()
+        lines = []
+        for name, value in sorted(snapshot["counters"].items()):
+            metric = self._metric_name(name) + "_total"
+            lines += [f"# TYPE {metric} counter", f"{metric} {value}"]
+        for name, histogram in sorted(snapshot["histograms"].items()):
+            metric = self._metric_name(name)
+            lines.append(f"# TYPE {metric} histogram")
+            for bound, count in histogram["buckets"].items():
+                lines.append(f'{metric}_bucket{{le="{bound}"}} {count}')
+            lines.append(f"{metric}_sum {histogram['sum']}")
+            lines.append(f"{metric}_count {histogram['count']}")
+        return "\n".join(lines) + "\n"
+
+    def _metric_name(self, name):
+        return self.prefix + re.sub(r"[^a-zA-Z0-9_]", "_", name)
+
+    def reset(self):
+        with self._lock:
+            self.counters.clear()
+            self.histograms.clear()
+            self.profiles.clear()
+
+
+metrics = Metrics()
@@ -0,0 +1,20 @@
+from parser.stub_encoder import HashingEncoder
+
+import pytest
+
+
+class CountingEncoder(HashingEncoder):
+    """HashingEncoder that records every text it encodes."""
+
+    def __init__(self, dimension=32):
+        super().__init__(dimension)
+        self.encoded = []
+
+    def encode(self, texts, **kwargs):
+        self.encoded.extend(texts)
+        return super().encode(texts, **kwargs)
+
+
+@pytest.fixture
+def encoder():
+    return CountingEncoder()
@@ -0,0 +1,109 @@
+from parser.embedding_cache import EmbeddingCache
+from parser.indexer import TextIndexer
+
+import numpy as np
+import pytest
+
+
+def test_reloaded_cache_serves_hits(tmp_path, encoder):
+    cache = EmbeddingCache(str(tmp_path), "model")
+    first = cache.encode(["alpha", "beta"], encoder.encode)
+
+    reloaded = EmbeddingCache(str(tmp_path), "model")
+    encoder.encoded.clear()
+    vectors = reloaded.encode(["beta", "alpha", "gamma"], encoder.encode)
+
+    assert encoder.encoded == ["gamma"]
+    np.testing.assert_array_equal(vectors[:2], first[::-1])
+    assert reloaded.stats()["hits"] == 2
+
+
+def test_texts_are_normalized_and_deduplicated(tmp_path, encoder):
+    cache = EmbeddingCache(str(tmp_path), "model")
+    vectors = cache.encode(["alpha  beta", "alpha beta", "alpha\nbeta"], encoder.encode)
+    assert encoder.encoded == ["alpha  beta"]
+    assert cache.stats()["deduplicated"] == 2
+    np.testing.assert_array_equal(vectors[0], vectors[2])
+
+
+def test_models_do_not_share_entries(tmp_path, encoder):
+    EmbeddingCache(str(tmp_path), "model").encode(["alpha"], encoder.encode)
+    EmbeddingCache(str(tmp_path), "other").encode(["alpha"], encoder.encode)
+    assert encoder.encoded == ["alpha", "alpha"]
+
+
+def test_least_recently_used_entry_is_evicted(tmp_path, encoder):
+    cache = EmbeddingCache(str(tmp_path), "model", max_entries=2)
+    cache.encode(["alpha", "beta"], encoder.encode)
+    cache.encode(["alpha"], encoder.encode)
+    cache.encode(["gamma"], encoder.encode)
+
+    reloaded = EmbeddingCache(str(tmp_path), "model")
+    encoder.encoded.clear()
+    vectors = reloaded.encode(["alpha", "beta", "gamma"], encoder.encode)
+
+    assert encoder.encoded == ["beta"]
+    assert reloaded.stats()["max_entries"] == 2
+    np.testing.assert_allclose(vectors, encoder.encode(["alpha", "beta", "gamma"]))
+
+
+def test_crash_during_eviction_does_not_serve_wrong_vectors(
+    tmp_path, encoder, monkeypatch
+):
+    cache = EmbeddingCache(str(tmp_path), "model", max_entries=2)
+    cache.encode(["alpha", "beta"], encoder.encode)
+
+    def crash(self):
+        save_keys(self)
+        raise KeyboardInterrupt
+
+    # Die right after the evicted key is forgotten, before its row is reused.
+    save_keys = EmbeddingCache._save_keys
+    monkeypatch.setattr(EmbeddingCache, "_save_keys", crash)
+    with pytest.raises(KeyboardInterrupt):
+        cache.encode(["gamma"], encoder.encode)
+    monkeypatch.undo()
+
+    reloaded = EmbeddingCache(str(tmp_path), "model")
+    vectors = reloaded.encode(["alpha", "beta"], encoder.encode)
+    np.testing.assert_allclose(vectors, encoder.encode(["alpha", "beta"]))
+
+
+def test_instances_sharing_a_directory_do_not_reuse_rows(tmp_path, encoder):
+    first = EmbeddingCache(str(tmp_path), "model")
+    second = EmbeddingCache(str(tmp_path), "model")
+    first.encode(["alpha"], encoder.encode)
+    second.encode(["beta"], encoder.encode)
+    first.encode(["gamma"], encoder.encode)
+
+    encoder.encoded.clear()
+    vectors = EmbeddingCache(str(tmp_path), "model").encode(
+        ["alpha", "beta", "gamma"], encoder.encode
+    )
+    assert encoder.encoded == []
+    np.testing.assert_allclose(vectors, encoder.encode(["alpha", "beta", "gamma"]))
+
+
+def test_instances_see_each_others_evictions(tmp_path, encoder):
+    first = EmbeddingCache(str(tmp_path), "model", max_entries=2)
+    second = EmbeddingCache(str(tmp_path), "model", max_entries=2)
+    first.encode(["alpha", "beta"], encoder.encode)
+    second.encode(["alpha"], encoder.encode)
+    assert second.stats()["hits"] == 1
+    second.encode(["gamma"], encoder.encode)
+
+    encoder.encoded.clear()
+    vectors = first.encode(["alpha", "beta", "gamma"], encoder.encode)
+    assert encoder.encoded == ["beta"]
+    np.testing.assert_allclose(vectors, encoder.encode(["alpha", "beta", "gamma"]))
+
+
+def test_indexer_encodes_cached_paragraphs_once(tmp_path, encoder):
+    documents = [{"text": "alpha beta", "file": "a.pdf"}]
+    for _ in range(2):
+        indexer = TextIndexer(
+            model_name="hashing-stub", cache_dir=str(tmp_path), encoder=encoder
+        )
+        indexer.add_documents(documents)
+    assert encoder.encoded == ["alpha beta"]
+    assert indexer.cache.stats()["hits"] == 1
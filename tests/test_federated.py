@@ -0,0 +1,91 @@
+from parser.federated import FederatedSearcher
+from parser.indexer import TextIndexer
+
+import pytest
+
+SHARDS = {
+    "a": ["alpha beta", "gamma", "delta words"],
+    "b": ["epsilon", "alpha gamma", "zeta eta"],
+    "c": ["theta iota", "kappa", "alpha delta"],
+}
+QUERIES = ["alpha", "gamma delta", "kappa words"]
+
+
+def build(path, encoder, documents):
+    indexer = TextIndexer(model_name="hashing-stub", encoder=encoder)
+    indexer.add_documents(documents)
+    indexer.save_index(path)
+
+
+@pytest.fixture
+def shards(tmp_path, encoder):
+    paths = []
+    for name, texts in SHARDS.items():
+        path = str(tmp_path / f"{name}.index")
+        build(path, encoder, [{"text": text, "file": f"{name}.pdf"} for text in texts])
+        paths.append(path)
+    return paths
+
+
+def test_merged_results_match_one_combined_index(tmp_path, encoder, shards):
+    combined = str(tmp_path / "combined.index")
+    build(
+        combined,
+        encoder,
+        [
+            {"text": text, "file": f"{name}.pdf"}
+            for name, texts in SHARDS.items()
+            for text in texts
+        ],
+    )
+    single = TextIndexer(model_name="hashing-stub", encoder=encoder)
+    single.load_index(combined)
+    searcher = FederatedSearcher(shards, model_name="hashing-stub", encoder=encoder)
+    try:
+        federated = searcher.search_batch(QUERIES, top_k=4)
+    finally:
+        searcher.close()
+
+    for merged, expected in zip(federated, single.search_batch(QUERIES, top_k=4)):
+        assert [r["score"] for r in merged] == pytest.approx(
+            [r["score"] for r in expected], abs=1e-5
+        )
+        # Results tied with the last one may come from either shard.
+        cutoff = expected[-1]["score"] + 1e-5
+        assert {r["id"] for r in merged if r["score"] > cutoff} == {
+            r["id"] for r in expected if r["score"] > cutoff
+        }
+        for result in merged:
+            assert result["shard"].endswith(result["file"][0] + ".index")
+
+
+def test_least_recently_used_shards_are_evicted(shards, encoder):
+    unbounded = FederatedSearcher(shards, model_name="hashing-stub", encoder=encoder)
+    try:
+        unbounded.search("alpha")
+    finally:
+        unbounded.close()
+    # The shards hold as many paragraphs each, so they estimate the same size.
+    size = unbounded.memory_usage() // len(shards)
+    assert size > 0
+
+    searcher = FederatedSearcher(
+        shards,
+        model_name="hashing-stub",
+        encoder=encoder,
+        memory_budget=2 * size,
+        max_workers=1,
+    )
+    try:
+        searcher.search("alpha")
+        assert searcher.stats()["loaded"] == 2
+        assert searcher.evictions == 1
+        # One worker searches the shards in order, so the first is evicted.
+        assert list(searcher._shards) == shards[1:]
+        searcher._shard(shards[1])
+        searcher._shard(shards[0])
+        assert list(searcher._shards) == [shards[1], shards[0]]
+        assert searcher.loads == 4
+        assert searcher.memory_usage() <= 2 * size
+    finally:
+        searcher.close()
@@ -0,0 +1,399 @@
+import json
+import os
+from parser.indexer import TextIndexer, paragraph_id
+
+import faiss
+import numpy as np
+import pytest
+
+
+def paragraphs(filename, *texts):
+    return [{"text": text, "file": filename, "header": "1.1 Terms"} for text in texts]
+
+
+@pytest.fixture
+def indexer(encoder):
+    return TextIndexer(model_name="hashing-stub", encoder=encoder)
+
+
+def test_add_documents_skips_indexed_paragraphs(indexer, encoder):
+    assert indexer.add_documents(paragraphs("a.pdf", "alpha beta", "gamma")) == 2
+    assert indexer.add_documents(paragraphs("a.pdf", "alpha beta", "delta")) == 1
+    assert encoder.encoded == ["alpha beta", "gamma", "delta"]
+    assert indexer.index.ntotal == 3
+
+
+def test_same_text_in_two_files_is_indexed_twice(indexer):
+    indexer.add_documents(paragraphs("a.pdf", "alpha") + paragraphs("b.pdf", "alpha"))
+    assert indexer.index.ntotal == 2
+    assert sorted(indexer.files) == ["a.pdf", "b.pdf"]
+
+
+def test_update_file_encodes_only_changed_paragraphs(indexer, encoder):
+    indexer.add_documents(paragraphs("a.pdf", "one", "two", "three"))
+    indexer.add_documents(paragraphs("b.pdf", "other"))
+    encoder.encoded.clear()
+
+    added, removed = indexer.update_file("a.pdf", paragraphs("a.pdf", "one", "four"))
+
+    assert (added, removed) == (1, 2)
+    assert encoder.encoded == ["four"]
+    assert sorted(indexer.data) == ["four", "one", "other"]
+    assert indexer.index.ntotal == 3
+    assert "two" not in indexer.search("two three", 3)
+
+
+def test_sync_removes_files_no_longer_present(indexer):
+    indexer.sync(paragraphs("a.pdf", "alpha") + paragraphs("b.pdf", "beta"))
+    added, removed = indexer.sync(paragraphs("b.pdf", "beta", "gamma"))
+
+    assert (added, removed) == (1, 1)
+    assert sorted(zip(indexer.files, indexer.data)) == [
+        ("b.pdf", "beta"),
+        ("b.pdf", "gamma"),
+    ]
+    assert indexer.index.ntotal == 2
+
+
+def test_search_results_follow_removals(indexer):
+    indexer.add_documents(paragraphs("a.pdf", "alpha beta") + paragraphs("b.pdf", "x"))
+    indexer.remove_file("a.pdf")
+    results = indexer.search_batch(["alpha beta"], 5)[0]
+    assert [(r["text"], r["file"]) for r in results] == [("x", "b.pdf")]
+
+
+def test_hnsw_index_is_rebuilt_without_removed_file(encoder):
+    indexer = TextIndexer(
+        model_name="hashing-stub", encoder=encoder, index_spec="HNSW8"
+    )
+    indexer.add_documents(
+        paragraphs("a.pdf", "alpha beta", "gamma")
+        + paragraphs("b.pdf", "delta", "epsilon zeta")
+    )
+    indexer.remove_file("a.pdf")
+
+    assert indexer.index.ntotal == 2
+    assert sorted(indexer.search("alpha beta", 5)) == ["delta", "epsilon zeta"]
+    assert indexer.search("epsilon zeta", 1) == ["epsilon zeta"]
+
+
+def test_sync_trains_ivf_index_on_every_file(encoder):
+    indexer = TextIndexer(
+        model_name="hashing-stub", encoder=encoder, index_spec="IVF16,Flat"
+    )
+    small = paragraphs("small.pdf", *(f"small {i}" for i in range(10)))
+    large = paragraphs("large.pdf", *(f"large {i} words" for i in range(400)))
+    assert indexer.sync(small + large) == (410, 0)
+    assert indexer.search("large 7 words", 1) == ["large 7 words"]
+
+
+def test_too_few_vectors_for_pq_raise_a_clear_error(encoder):
+    indexer = TextIndexer(
+        model_name="hashing-stub", encoder=encoder, index_spec="IVF4,PQ8"
+    )
+    indexer.data = [f"paragraph {i}" for i in range(100)]
+    with pytest.raises(ValueError, match="product quantizer"):
+        indexer.build_index()
+
+
+def test_tuning_stops_at_the_first_setting_reaching_the_target(encoder):
+    indexer = TextIndexer(
+        model_name="hashing-stub", encoder=encoder, index_spec="IVF16,Flat"
+    )
+    indexer.add_documents(paragraphs("a.pdf", *(f"text {i} words" for i in range(400))))
+    queries = [f"text {i}" for i in range(20)]
+    candidates = [{"nprobe": 16}, {"nprobe": 1}]
+    report = indexer.tune_search_params(queries, k=5, candidates=candidates)
+    assert report["params"] == {"nprobe": 16}
+    assert report["recall"] >= 0.95
+    assert len(report["trials"]) == 1
+
+
+def test_saved_index_can_be_updated(tmp_path, indexer, encoder):
+    indexer.add_documents(paragraphs("a.pdf", "alpha", "beta"))
+    path = str(tmp_path / "test.index")
+    indexer.save_index(path)
+
+    loaded = TextIndexer(model_name="hashing-stub", encoder=encoder)
+    loaded.load_index(path)
+    encoder.encoded.clear()
+    assert loaded.update_file("a.pdf", paragraphs("a.pdf", "beta", "gamma")) == (1, 1)
+    assert encoder.encoded == ["gamma"]
+    loaded.save_index(path)
+
+    reloaded = TextIndexer(model_name="hashing-stub", encoder=encoder)
+    reloaded.load_index(path)
+    assert sorted(reloaded.data) == ["beta", "gamma"]
+    assert reloaded.search("gamma", 1) == ["gamma"]
+
+
+def test_rebuilding_a_loaded_index_keeps_files_and_headers(tmp_path, indexer):
+    indexer.add_documents(paragraphs("a.pdf", "alpha", "beta"))
+    path = str(tmp_path / "docs.index")
+    indexer.save_index(path)
+
+    loaded = TextIndexer(model_name="hashing-stub", encoder=indexer.encoder)
+    loaded.load_index(path)
+    ids = sorted(loaded.ids)
+    loaded.build_index(index_spec="HNSW8")
+    assert list(loaded.files) == ["a.pdf", "a.pdf"]
+    assert list(loaded.headers) == ["1.1 Terms", "1.1 Terms"]
+    assert sorted(loaded.ids) == ids
+
+
+def test_explicit_rerank_factor_overrides_the_saved_one(tmp_path, encoder):
+    indexer = TextIndexer(
+        model_name="hashing-stub", encoder=encoder, compression="int8"
+    )
+    indexer.add_documents(paragraphs("a.pdf", "alpha", "beta"))
+    indexer.build_index(rerank_factor=2)
+    path = str(tmp_path / "docs.index")
+    indexer.save_index(path)
+
+    saved = TextIndexer(model_name="hashing-stub", encoder=encoder)
+    saved.load_index(path)
+    assert saved.rerank_factor == 2
+    explicit = TextIndexer(model_name="hashing-stub", encoder=encoder, rerank_factor=8)
+    explicit.load_index(path)
+    assert explicit.rerank_factor == 8
+
+
+def test_memory_usage_leaves_out_mapped_data(tmp_path, indexer, encoder):
+    texts = [f"paragraph {i} " * 20 for i in range(100)]
+    indexer.add_documents(paragraphs("a.pdf", *texts))
+    in_memory = indexer.memory_usage()
+    assert in_memory > 100 * (32 * 4 + len(texts[0]))
+    path = str(tmp_path / "docs.index")
+    indexer.save_index(path)
+
+    mapped = TextIndexer(model_name="hashing-stub", encoder=encoder)
+    mapped.load_index(path)
+    assert mapped.memory_usage() < 100 * 32 * 4
+    loaded = TextIndexer(model_name="hashing-stub", encoder=encoder)
+    loaded.load_index(path, mmap=False)
+    assert loaded.memory_usage() >= 100 * 32 * 4
+
+
+def test_legacy_index_is_rekeyed_by_paragraph(tmp_path, encoder):
+    texts = ["alpha beta", "gamma", "alpha beta"]
+    vectors = np.ascontiguousarray(encoder.encode(texts), dtype=np.float32)
+    faiss.normalize_L2(vectors)
+    legacy = faiss.IndexFlatL2(vectors.shape[1])
+    legacy.add(vectors)
+    path = str(tmp_path / "legacy.index")
+    faiss.write_index(legacy, path)
+    with open(path + "_paragraphs.json", "w") as f:
+        json.dump(texts, f)
+
+    indexer = TextIndexer(model_name="hashing-stub", encoder=encoder)
+    indexer.load_index(path)
+    assert indexer.search("gamma", 1) == ["gamma"]
+
+    encoder.encoded.clear()
+    added, removed = indexer.sync(
+        [{"text": "gamma", "file": None}, {"text": "delta", "file": None}]
+    )
+    assert (added, removed) == (1, 1)
+    assert encoder.encoded == ["delta"]
+    assert indexer.ids == [paragraph_id(None, "gamma"), paragraph_id(None, "delta")]
+    assert indexer.index.ntotal == 2
+
+
+def test_streamed_index_matches_one_built_in_memory(tmp_path, encoder):
+    docs = [
+        paragraphs(f"{name}.pdf", *(f"{name} paragraph {i}" for i in range(20)))
+        for name in ("a", "b", "c")
+    ]
+    path = str(tmp_path / "stream.index")
+    streamed = TextIndexer(
+        model_name="hashing-stub", encoder=encoder, compression="int8"
+    )
+    streamed.stream_to(path)
+    for batch in docs:
+        streamed.add_documents(batch)
+    assert streamed.data == []
+    streamed.save_index(path)
+
+    built = TextIndexer(model_name="hashing-stub", encoder=encoder, compression="int8")
+    built.add_documents([doc for batch in docs for doc in batch])
+    loaded = TextIndexer(model_name="hashing-stub", encoder=encoder)
+    loaded.load_index(path)
+
+    queries = ["b paragraph 7", "c paragraph 13"]
+    assert streamed.search_batch(queries, 3) == built.search_batch(queries, 3)
+    assert loaded.search_batch(queries, 3) == built.search_batch(queries, 3)
+    assert list(loaded.files) == built.files
+
+
+def test_streaming_extends_a_saved_index(tmp_path, encoder):
+    path = str(tmp_path / "stream.index")
+    indexer = TextIndexer(model_name="hashing-stub", encoder=encoder)
+    indexer.add_documents(paragraphs("a.pdf", "alpha", "beta"))
+    indexer.save_index(path)
+
+    extended = TextIndexer(model_name="hashing-stub", encoder=encoder)
+    extended.load_index(path)
+    extended.stream_to(path)
+    encoder.encoded.clear()
+    assert extended.add_documents(paragraphs("a.pdf", "beta", "gamma")) == 1
+    with pytest.raises(RuntimeError):
+        extended.remove_file("a.pdf")
+    extended.save_index(path)
+
+    assert encoder.encoded == ["gamma"]
+    reloaded = TextIndexer(model_name="hashing-stub", encoder=encoder)
+    reloaded.load_index(path)
+    assert list(reloaded.data) == ["alpha", "beta", "gamma"]
+    assert reloaded.search("gamma", 1) == ["gamma"]
+
+
+def test_search_batch_returns_ids_files_headers_and_scores(indexer, encoder):
+    indexer.add_documents(paragraphs("a.pdf", "alpha beta", "gamma delta"))
+    indexer.add_documents(paragraphs("b.pdf", "alpha epsilon"))
+    results = indexer.search_batch(["alpha beta", "gamma delta"], top_k=3)
+
+    vectors = np.ascontiguousarray(
+        encoder.encode(["alpha beta", "gamma delta", "alpha epsilon"]),
+        dtype=np.float32,
+    )
+    faiss.normalize_L2(vectors)
+    files = {"alpha beta": "a.pdf", "gamma delta": "a.pdf", "alpha epsilon": "b.pdf"}
+    for query, query_results in zip(["alpha beta", "gamma delta"], results):
+        assert len(query_results) == 3
+        assert query_results[0]["text"] == query
+        assert query_results[0]["score"] == pytest.approx(1.0, abs=1e-5)
+        scores = [result["score"] for result in query_results]
+        assert scores == sorted(scores, reverse=True)
+        query_vector = vectors[list(files).index(query)]
+        for result in query_results:
+            assert result["file"] == files[result["text"]]
+            assert result["header"] == "1.1 Terms"
+            assert result["id"] == paragraph_id(result["file"], result["text"])
+            expected = vectors[list(files).index(result["text"])] @ query_vector
+            assert result["score"] == pytest.approx(expected, abs=1e-5)
+
+
+def test_ivf_padding_is_dropped_from_results(encoder):
+    indexer = TextIndexer(
+        model_name="hashing-stub", encoder=encoder, index_spec="IVF16,Flat"
+    )
+    indexer.add_documents(paragraphs("a.pdf", *(f"text {i} words" for i in range(400))))
+    indexer.set_search_params(nprobe=1)
+    vectors = np.ascontiguousarray(encoder.encode(["text 7"]), dtype=np.float32)
+    faiss.normalize_L2(vectors)
+    _, labels = indexer.index.search(vectors, 300)
+    assert (labels == -1).any()
+
+    results = indexer.search_vectors(vectors, top_k=300)[0]
+    assert len(results) == (labels >= 0).sum()
+    known = set(indexer.ids)
+    assert all(result["id"] in known for result in results)
+
+
+def test_labels_unknown_to_the_store_are_dropped(indexer, encoder):
+    indexer.add_documents(paragraphs("a.pdf", "alpha", "beta"))
+    stray = np.ascontiguousarray(encoder.encode(["alpha"]), dtype=np.float32)
+    faiss.normalize_L2(stray)
+    indexer.index.add_with_ids(stray, np.array([12345], dtype=np.int64))
+
+    results = indexer.search_vectors(stray, top_k=3)[0]
+    assert [result["text"] for result in results] == ["alpha", "beta"]
+    assert 12345 not in [result["id"] for result in results]
+
+
+def test_legacy_sidecar_is_loaded_with_unicode_texts(tmp_path, encoder):
+    texts = ["Übersicht der Verträge", "日本語の段落"]
+    vectors = np.ascontiguousarray(encoder.encode(texts), dtype=np.float32)
+    faiss.normalize_L2(vectors)
+    legacy = faiss.IndexFlatL2(vectors.shape[1])
+    legacy.add(vectors)
+    path = str(tmp_path / "legacy.index")
+    faiss.write_index(legacy, path)
+    with open(path + "_paragraphs.json", "w", encoding="utf-8") as f:
+        json.dump(texts, f, ensure_ascii=False)
+
+    indexer = TextIndexer(model_name="hashing-stub", encoder=encoder)
+    indexer.load_index(path)
+    assert list(indexer.data) == texts
+    results = indexer.search_batch(["日本語の段落"], top_k=2)[0]
+    assert [result["text"] for result in results] == ["日本語の段落", texts[0]]
+    assert [result["id"] for result in results] == [1, 0]
+    assert results[0]["file"] is None and results[0]["header"] is None
+
+
+def test_saving_keeps_the_version_another_indexer_has_mapped(tmp_path, encoder):
+    writer = TextIndexer(model_name="hashing-stub", encoder=encoder, compression="int8")
+    writer.add_documents(paragraphs("a.pdf", "alpha beta", "gamma"))
+    path = str(tmp_path / "docs.index")
+    writer.save_index(path)
+    reader = TextIndexer(model_name="hashing-stub", encoder=encoder)
+    reader.load_index(path)
+
+    for texts in (["delta"], ["epsilon"]):
+        writer.add_documents(paragraphs("b.pdf", *texts))
+        writer.save_index(path)
+        # The first save after loading keeps the reader's store on disk, the
+        # next removes it while the reader still has it mapped.
+        results = reader.search_batch(["alpha beta", "gamma"], top_k=2)
+        assert [r[0]["text"] for r in results] == ["alpha beta", "gamma"]
+        assert [len(r) for r in results] == [2, 2]
+
+    stores = [entry for entry in os.listdir(tmp_path) if "_store" in entry]
+    assert len(stores) == 2
+    fresh = TextIndexer(model_name="hashing-stub", encoder=encoder)
+    fresh.load_index(path)
+    assert sorted(fresh.data) == ["alpha beta", "delta", "epsilon", "gamma"]
+
+
+def normalized(encoder, texts):
+    vectors = np.ascontiguousarray(encoder.encode(list(texts)), dtype=np.float32)
+    faiss.normalize_L2(vectors)
+    return vectors
+
+
+def test_rerank_returns_the_exact_top_k(encoder):
+    texts = [f"text {i} words {i * 7 % 13} clause {i % 5}" for i in range(300)]
+    indexer = TextIndexer(
+        model_name="hashing-stub",
+        encoder=encoder,
+        compression="int8",
+        rerank_factor=30,
+    )
+    indexer.add_documents(paragraphs("a.pdf", *texts))
+    queries = ["text 3 words", "clause 4", "words 12 clause 1"]
+    query_vectors = normalized(encoder, queries)
+    scores = query_vectors @ normalized(encoder, texts).T
+
+    for row, results in enumerate(indexer.search_vectors(query_vectors, top_k=10)):
+        expected = np.sort(scores[row])[::-1][:10]
+        found = [result["score"] for result in results]
+        assert found == pytest.approx(expected.tolist(), abs=1e-5)
+        for result in results:
+            assert result["score"] == pytest.approx(
+                scores[row, texts.index(result["text"])], abs=1e-5
+            )
+
+
+def test_full_vectors_stay_aligned_after_removal_and_reload(tmp_path, encoder):
+    indexer = TextIndexer(
+        model_name="hashing-stub", encoder=encoder, compression="int8"
+    )
+    indexer.add_documents(paragraphs("a.pdf", "alpha beta", "gamma"))
+    indexer.add_documents(paragraphs("b.pdf", "delta", "epsilon"))
+    indexer.add_documents(paragraphs("c.pdf", "zeta eta"))
+    indexer.remove_file("b.pdf")
+
+    def assert_aligned(indexer):
+        assert sorted(indexer.data) == ["alpha beta", "gamma", "zeta eta"]
+        np.testing.assert_allclose(
+            indexer._full_vectors(), normalized(encoder, indexer.data), atol=1e-6
+        )
+        for text in indexer.data:
+            assert indexer.search(text, 1) == [text]
+
+    assert_aligned(indexer)
+    path = str(tmp_path / "docs.index")
+    indexer.save_index(path)
+    reloaded = TextIndexer(model_name="hashing-stub", encoder=encoder)
+    reloaded.load_index(path)
+    assert_aligned(reloaded)
@@ -0,0 +1,23 @@
+from parser.indexer import TextIndexer
+from parser.ingest import find_pdfs, ingest
+
+import fitz
+
+
+def write_pdf(path, *texts):
+    pdf_document = fitz.open()
+    for text in texts:
+        pdf_document.new_page().insert_text((50, 72), text)
+    pdf_document.save(str(path))
+    pdf_document.close()
+
+
+def test_unreadable_pdfs_are_skipped(tmp_path, encoder):
+    write_pdf(tmp_path / "a.pdf", "First paragraph.", "Second paragraph.")
+    (tmp_path / "broken.pdf").write_bytes(b"%PDF-1.4 not really a pdf")
+    indexer = TextIndexer(model_name="hashing-stub", encoder=encoder)
+
+    added = ingest(find_pdfs([str(tmp_path)]), indexer, workers=1)
+
+    assert added == 2
+    assert indexer.search("Second paragraph.", 1) == ["Second paragraph."]
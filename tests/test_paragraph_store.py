@@ -0,0 +1,47 @@
+from parser.paragraph_store import ParagraphStore, ParagraphStoreWriter
+
+import numpy as np
+
+
+def test_store_round_trips_batches(tmp_path):
+    texts = ["Übersicht der Verträge", "naïve café", "", "日本語の段落", "plain"]
+    ids = [5, 3, 9, 1, 7]
+    files = ["a.pdf", None, "a.pdf", "ü.pdf", None]
+    headers = [None, "1.1 Terms", "1.1 Terms", None, "2.1 Zahlung"]
+    writer = ParagraphStoreWriter(str(tmp_path / "store"))
+    writer.append(texts[:2], ids[:2], files[:2], headers[:2])
+    writer.append(texts[2:], ids[2:], files[2:], headers[2:])
+    writer.close()
+
+    store = ParagraphStore(str(tmp_path / "store"))
+    assert len(store) == 5
+    assert list(store.texts) == texts
+    assert store.ids.tolist() == ids
+    assert list(store.files) == files
+    assert list(store.headers) == headers
+    assert store.texts[3] == "日本語の段落"
+    assert store.sorted_ids.tolist() == sorted(ids)
+    assert [ids[p] for p in store.positions] == sorted(ids)
+
+
+def test_empty_store_round_trips(tmp_path):
+    ParagraphStore.write(str(tmp_path / "store"), [], [], [], [])
+    store = ParagraphStore(str(tmp_path / "store"))
+    assert len(store) == 0
+    assert list(store.texts) == []
+    assert list(store.files) == []
+    assert list(store.headers) == []
+    assert store.sorted_ids.tolist() == []
+
+
+def test_vectors_are_written_aligned_with_paragraphs(tmp_path):
+    vectors = np.arange(12, dtype=np.float32).reshape(3, 4)
+    writer = ParagraphStoreWriter(str(tmp_path / "store"))
+    writer.append(["a", "b"], [1, 2], [None, None], [None, None])
+    writer.append_vectors(vectors[:2])
+    writer.append(["c"], [3], [None], [None])
+    writer.append_vectors(vectors[2:])
+    writer.close()
+
+    stored = np.fromfile(str(tmp_path / "store" / "vectors.f32"), dtype=np.float32)
+    np.testing.assert_array_equal(stored.reshape(3, 4), vectors)
@@ -0,0 +1,150 @@
+import json
+import threading
+import time
+import urllib.error
+import urllib.request
+from parser.indexer import TextIndexer
+from parser.server import MicroBatcher, Overloaded, SearchClient, SearchServer
+
+import pytest
+
+TEXTS = ["alpha beta", "gamma", "delta", "epsilon"]
+
+
+class RecordingIndexer(TextIndexer):
+    """TextIndexer recording its search batches, optionally held at a gate."""
+
+    def __init__(self, encoder):
+        super().__init__(model_name="hashing-stub", encoder=encoder)
+        self.batches = []
+        self.started = threading.Event()
+        self.gate = threading.Event()
+        self.gate.set()
+
+    def search_batch(self, queries, top_k=2):
+        self.batches.append(list(queries))
+        self.started.set()
+        self.gate.wait(10)
+        return super().search_batch(queries, top_k)
+
+
+@pytest.fixture
+def indexer(encoder):
+    indexer = RecordingIndexer(encoder)
+    indexer.add_documents([{"text": text, "file": "a.pdf"} for text in TEXTS])
+    return indexer
+
+
+@pytest.fixture
+def serve():
+    started = []
+
+    def serve(batcher, **kwargs):
+        server = SearchServer(("127.0.0.1", 0), batcher, **kwargs)
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+        started.append(server)
+        return f"http://127.0.0.1:{server.server_address[1]}"
+
+    yield serve
+    for server in started:
+        server.shutdown()
+        server.server_close()
+        server.batcher.indexer.gate.set()
+        server.batcher.close()
+
+
+def post(url, body):
+    request = urllib.request.Request(url + "/search", data=body)
+    try:
+        with urllib.request.urlopen(request, timeout=10) as response:
+            return response.status, json.load(response)
+    except urllib.error.HTTPError as e:
+        return e.code, json.loads(e.read())
+
+
+def test_concurrent_queries_are_coalesced(indexer):
+    batcher = MicroBatcher(indexer, max_batch_size=8, max_wait_ms=200, workers=1)
+    try:
+        pending = [batcher.submit(text, 1) for text in TEXTS]
+        results = [future.result(10) for future in pending]
+    finally:
+        batcher.close()
+    assert [result[0]["text"] for result in results] == TEXTS
+    assert indexer.batches == [TEXTS]
+
+
+def test_a_lone_query_waits_at_most_max_wait(indexer):
+    batcher = MicroBatcher(indexer, max_batch_size=64, max_wait_ms=50)
+    try:
+        start = time.monotonic()
+        result = batcher.search("gamma", 1, timeout=10)
+        elapsed = time.monotonic() - start
+    finally:
+        batcher.close()
+    assert result[0]["text"] == "gamma"
+    assert 0.04 <= elapsed < 5
+    assert indexer.batches == [["gamma"]]
+
+
+def test_full_queue_rejects_queries(indexer):
+    batcher = MicroBatcher(indexer, max_batch_size=1, max_queue=2, workers=1)
+    indexer.gate.clear()
+    try:
+        pending = [batcher.submit("alpha beta")]
+        assert indexer.started.wait(10)
+        with pytest.raises(Overloaded):
+            # The dispatcher holds one query while the worker is busy, the
+            # queue the next two.
+            for _ in range(4):
+                pending.append(batcher.submit("gamma"))
+        indexer.gate.set()
+        assert all(future.result(10) for future in pending)
+    finally:
+        indexer.gate.set()
+        batcher.close()
+
+
+def test_invalid_requests_are_rejected(indexer, serve):
+    url = serve(MicroBatcher(indexer), max_top_k=10, max_queries=2)
+    bodies = [
+        b"not json",
+        b"[1, 2]",
+        b'{"query": 5}',
+        b'{"queries": "alpha"}',
+        b'{"queries": ["alpha", 5]}',
+        b'{"top_k": 1}',
+        b'{"query": "alpha", "top_k": 0}',
+        b'{"query": "alpha", "top_k": 11}',
+    ]
+    for body in bodies:
+        status, reply = post(url, body)
+        assert status == 400, body
+        assert "error" in reply
+    assert post(url, b'{"queries": ["a", "b", "c"]}')[0] == 413
+    assert indexer.batches == []
+
+    status, reply = post(url, b'{"query": "gamma", "top_k": 1}')
+    assert status == 200
+    assert reply["results"][0]["text"] == "gamma"
+
+
+def test_overloaded_server_answers_503(indexer, serve):
+    batcher = MicroBatcher(indexer, max_batch_size=1, max_queue=2, workers=1)
+    url = serve(batcher, max_queries=2)
+    indexer.gate.clear()
+    batcher.submit("alpha beta")
+    assert indexer.started.wait(10)
+    with pytest.raises(Overloaded):
+        for _ in range(4):
+            batcher.submit("gamma")
+
+    status, reply = post(url, b'{"queries": ["gamma", "delta"]}')
+    assert status == 503
+    assert "waiting" in reply["error"]
+
+
+def test_client_splits_batches_into_allowed_requests(indexer, serve):
+    client = SearchClient(serve(MicroBatcher(indexer), max_queries=2))
+    results = client.search_batch(TEXTS + ["gamma"], top_k=1)
+    assert [result[0]["text"] for result in results] == TEXTS + ["gamma"]
+    assert client.health()["max_queries"] == 2